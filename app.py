@@ -1,60 +1,575 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, abort
-from database import init_db, get_db, close_db
+from dotenv import load_dotenv
+
+# Load environment variables before the modules below read their settings
+load_dotenv()
+
+from flask import Flask, Blueprint, current_app, g, render_template, request, redirect, url_for, session, flash, \
+    send_from_directory, abort, stream_with_context, jsonify, send_file
+from database import migrate, check_schema, get_db, close_db, get_db_connection, pool_stats, \
+    db_backend_state, run_concurrently, get_read_db, replica_state
+import metrics
+from profiling import profiler
+from cache import TTLCache
+from media import MEDIA_COLUMNS, cloudinary_uploader, create_uploader
+from course_io import CourseImportError, read_courses, import_courses, export_courses, dump_json, dump_csv
+from pdf_storage import PDF_MAX_SIZE, PDFRejected, blob_filename, spool_pdf
+from contextlib import contextmanager
 from datetime import datetime
+from werkzeug.http import is_resource_modified
+import hashlib
+import secrets
+import time
+from markupsafe import Markup, escape
 import psycopg2
 import psycopg2.extras
 import os
-import secrets
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+import mimetypes
+import click
 from werkzeug.security import generate_password_hash, check_password_hash
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
-# Debug: Print Cloudinary environment variables
-print('cloud_name:', os.environ.get('cloud_name'))
-print('api_key:', os.environ.get('api_key'))
-print('api_secret:', os.environ.get('api_secret'))
-print('cloud_url:', os.environ.get('cloud_url'))
-
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key')
+# Routes, hooks and CLI commands; create_app() registers them on an app
+bp = Blueprint('main', __name__, cli_group=None)
 
 # Configure file upload settings (for images/videos in other routes)
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'webm'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.environ.get('cloud_name'),
-    api_key=os.environ.get('api_key'),
-    api_secret=os.environ.get('api_secret'),
-    cloud_url=os.environ.get('cloud_url')
-)
 
-# Initialize DB connection before each request
-@app.before_request
+# Keyset pagination limits for long listings
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+# Grading queue: each grader session claims up to GRADING_BATCH_SIZE pending
+# submissions, hidden from other graders for GRADING_CLAIM_TTL seconds
+GRADING_BATCH_SIZE = int(os.environ.get('GRADING_BATCH_SIZE', 20))
+GRADING_CLAIM_TTL = int(os.environ.get('GRADING_CLAIM_TTL', 900))
+
+# Search results per page, and how deep ranked results can be paged
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGES = 25
+# Highlight markers passed to ts_headline, replaced by <mark> after escaping
+HIGHLIGHT_START, HIGHLIGHT_STOP = '\u27e6', '\u27e7'
+
+# Course metadata and ordered topic lists, invalidated by the instructor write routes
+catalog_cache = TTLCache(
+    maxsize=int(os.environ.get('CATALOG_CACHE_SIZE', 512)),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', 300))
+)
+# Logged-in users' rows (without the password hash), keyed by user id
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 300))
+)
+USER_COLUMNS = 'id, firstname, lastname, email, role, version'
+
+# Uploaded files never change under the same name (random or content-hash
+# names), so browsers may cache them for a long time
+UPLOAD_MAX_AGE = int(os.environ.get('UPLOAD_MAX_AGE', 365 * 24 * 3600))
+# Behind nginx, set X_ACCEL_PREFIX to an internal location aliased to
+# static/uploads (or USE_X_SENDFILE=1 for Apache/lighttpd) to offload transfers
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX')
+USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == '1'
+
+# Application factory, used by `flask --app app` and wsgi.py
+def create_app(config=None):
+    """Build the Flask app; ``config`` overrides the defaults below.
+
+    Nothing here touches the network or the filesystem: the connection
+    pool, Cloudinary and the upload directories are all set up on first
+    use, so each forked worker opens its own connections.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY=os.environ.get('SECRET_KEY', 'your-secret-key'),
+        UPLOAD_FOLDER=UPLOAD_FOLDER,
+        USE_X_SENDFILE=USE_X_SENDFILE,
+    )
+    app.config.update(config or {})
+    app.register_blueprint(bp)
+    profiler.init_app(app)
+    return app
+
+# Verify the schema version once per process, on the first request. An
+# outdated schema fails requests (and is re-checked) until init-db has run.
+_schema_checked = False
+
+@bp.before_app_request
 def before_request():
-    init_db()
+    global _schema_checked
+    if not _schema_checked:
+        check_schema()
+        _schema_checked = True
+
+# Attach the logged-in user to g.user, reading the users table only on a cache miss.
+# session['user_version'] is the version this session last wrote or saw at login,
+# so a snapshot older than that is reloaded in every worker.
+@bp.before_app_request
+def load_user():
+    g.user = None
+    user_id = session.get('user_id')
+    if user_id is None:
+        return
+    user = user_cache.get(user_id)
+    if user is None or user['version'] < session.get('user_version', 0):
+        cur = get_db().cursor()
+        user = fetch_user(cur, user_id)
+        cur.close()
+        if user is not None:
+            user_cache.set(user_id, user)
+    g.user = user
+
+# Apply pending schema migrations: `flask --app app init-db`
+@bp.cli.command('init-db')
+def init_db_command():
+    version = migrate()
+    print(f'Database schema is at version {version}')
+
+# Bulk-load a curriculum: `flask --app app import-courses courses.json --instructor teacher@example.com`
+@bp.cli.command('import-courses')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--instructor', 'email', required=True, help='Email of the instructor who will own the courses.')
+@click.option('--format', 'fmt', type=click.Choice(['json', 'csv']), help='Defaults to the file extension.')
+def import_courses_command(path, email, fmt):
+    fmt = fmt or path.rsplit('.', 1)[-1].lower()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users WHERE email = %s AND role = 'instructor'", (email,))
+        instructor = cur.fetchone()
+        if not instructor:
+            raise click.ClickException(f'No instructor with email {email}')
+        with open(path, 'rb') as f:
+            courses = read_courses(f, fmt)
+        course_ids, topic_count = import_courses(cur, courses, instructor[0])
+        conn.commit()
+    except CourseImportError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+    print(f'Imported {len(course_ids)} courses with {topic_count} topics')
+
+# Dump courses and topics: `flask --app app export-courses out.csv --format csv`
+@bp.cli.command('export-courses')
+@click.argument('path', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['json', 'csv']), default='json')
+def export_courses_command(path, fmt):
+    conn = get_db_connection()
+    try:
+        for chunk in (dump_csv if fmt == 'csv' else dump_json)(export_courses(conn)):
+            path.write(chunk)
+    finally:
+        conn.close()
+
+# Per-request latency and query metrics
+@bp.before_app_request
+def start_request_metrics():
+    metrics.registry.start_request()
+
+@bp.after_app_request
+def finish_request_metrics(response):
+    return metrics.registry.finish_request(response)
+
+# Opt-in sampling profiler (PROFILE_SAMPLE_RATE)
+@bp.before_app_request
+def start_request_profile():
+    profiler.start_request()
+
+@bp.after_app_request
+def finish_request_profile(response):
+    return profiler.finish_request(response)
+
+@bp.teardown_app_request
+def abandon_request_profile(exception):
+    profiler.abandon()
+
+# Keep this session's reads on the primary for a while after it writes
+@bp.after_app_request
+def remember_write(response):
+    if g.get('db_committed'):
+        session['db_written_at'] = time.time()
+    return response
 
 # Close DB connection after each request
-@app.teardown_appcontext
+@bp.teardown_app_request
 def teardown_db(exception):
     close_db(exception)
 
+def fetch_user(cur, user_id):
+    cur.execute(f'SELECT {USER_COLUMNS} FROM users WHERE id = %s', (user_id,))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+def user_updated(user):
+    """Refresh caches after a write to ``user``'s row (which must bump its version)."""
+    user_cache.set(user['id'], user)
+    if session.get('user_id') == user['id']:
+        session['user_version'] = user['version']
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def record_milestone(cur, user_id, course_id, milestone):
+    """Mark a milestone reached; a no-op if already recorded or not enrolled."""
+    cur.execute('''
+        INSERT INTO enrollment_milestones (user_id, course_id, milestone)
+        SELECT user_id, course_id, %s FROM enrollments WHERE user_id = %s AND course_id = %s
+        ON CONFLICT DO NOTHING
+    ''', (milestone, user_id, course_id))
+
+def encode_cursor(row, columns):
+    values = [row[column.split('.')[-1]] for column in columns]
+    return '_'.join(v.isoformat() if isinstance(v, datetime) else str(v) for v in values)
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        timestamp, row_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        abort(400)
+
+def fetch_page(cur, sql, params, columns, descending=True):
+    """Run a keyset-paginated query and return (rows, pagination links).
+
+    ``sql`` needs ``{where}`` (an extra AND clause) and ``{order}`` slots;
+    ``columns`` is the (timestamp, id) sort key. The ``after``/``before``
+    query arguments carry the cursor, so every page costs one index range
+    scan however deep the user pages.
+    """
+    size = max(1, min(request.args.get('per_page', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    after = decode_cursor(request.args.get('after'))
+    before = decode_cursor(request.args.get('before'))
+    forward = after is not None or before is None
+    cursor = after if forward else before
+    newer_first = descending == forward
+    where = ''
+    if cursor:
+        where = f"AND ({', '.join(columns)}) {'<' if newer_first else '>'} (%s, %s)"
+        params = tuple(params) + cursor
+    direction = 'DESC' if newer_first else 'ASC'
+    order = ', '.join(f'{column} {direction}' for column in columns)
+    cur.execute(sql.format(where=where, order=order) + ' LIMIT %s', tuple(params) + (size + 1,))
+    rows = cur.fetchall()
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if not forward:
+        rows.reverse()
+    page = {'next': None, 'prev': None, 'per_page': size}
+    if rows:
+        if has_more if forward else cursor:
+            page['next'] = encode_cursor(rows[-1], columns)
+        if cursor if forward else has_more:
+            page['prev'] = encode_cursor(rows[0], columns)
+    return rows, page
+
+@contextmanager
+def primary_cursor(cur):
+    """``cur`` if it is on the primary, else a short-lived primary cursor.
+
+    Cache misses are filled through this: a lagging replica could otherwise
+    put a row that was just invalidated back into the cache for its TTL.
+    """
+    db = get_db()
+    if cur.connection is db:
+        yield cur
+        return
+    fill = db.cursor()
+    try:
+        yield fill
+    finally:
+        fill.close()
+
+def load_course(cur, course_id):
+    def load():
+        with primary_cursor(cur) as fill:
+            fill.execute('SELECT * FROM courses WHERE id = %s', (course_id,))
+            row = fill.fetchone()
+        return dict(row) if row else None
+    return catalog_cache.get_or_load(('course', course_id), load)
+
+def load_topics(cur, course_id):
+    """Ordered topics (id, topic_index, heading, content) of a course."""
+    def load():
+        with primary_cursor(cur) as fill:
+            fill.execute('''
+                SELECT id, topic_index, heading, content, version, updated_at
+                FROM topics WHERE course_id = %s ORDER BY topic_index
+            ''', (course_id,))
+            return [dict(t) for t in fill.fetchall()]
+    return catalog_cache.get_or_load(('topics', course_id), load)
+
+def load_catalog(cur):
+    """Every course with its topic count."""
+    def load():
+        with primary_cursor(cur) as fill:
+            fill.execute('''
+                SELECT c.*, COALESCE(t.topic_count, 0) AS topic_count
+                FROM courses c
+                LEFT JOIN (SELECT course_id, COUNT(*) AS topic_count FROM topics GROUP BY course_id) t
+                       ON t.course_id = c.id
+                ORDER BY c.id
+            ''')
+            return [dict(c) for c in fill.fetchall()]
+    return catalog_cache.get_or_load('catalog', load)
+
+def invalidate_course(course_id=None):
+    """Drop cached catalog data after a course or its topics change."""
+    catalog_cache.invalidate('catalog')
+    if course_id is not None:
+        course_id = int(course_id)
+        catalog_cache.invalidate(('course', course_id), ('topics', course_id))
+
+def render_conditional(etag_parts, template, last_modified=None, **context):
+    """Render ``template`` unless the browser's cached copy is still current.
+
+    The ETag hashes ``etag_parts`` together with the user id, and responses
+    are marked private so shared caches never serve one student's page to
+    another. Pending flash messages always force a full render.
+    """
+    etag = hashlib.sha1(repr((session.get('user_id'), etag_parts)).encode()).hexdigest()
+    response = current_app.response_class(mimetype='text/html')
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if '_flashes' not in session and not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+    response.set_data(render_template(template, **context))
+    return response
+
+# Course images and videos are uploaded by background workers
+media_uploader = create_uploader(on_complete=invalidate_course)
+
+def spool_media():
+    """Spool valid image/video uploads to disk; returns {kind: (path, public_id)}."""
+    spooled = {}
+    for kind in MEDIA_COLUMNS:
+        file = request.files.get(kind)
+        if file and allowed_file(file.filename):
+            spooled[kind] = media_uploader.spool(file)
+    return spooled
+
+def serve_upload(filename, download_name=None, as_attachment=False):
+    """Serve a file from UPLOAD_FOLDER with Range, ETag and long-lived cache headers."""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    if X_ACCEL_PREFIX:
+        path = safe_join(upload_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = current_app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{X_ACCEL_PREFIX.rstrip('/')}/{filename}"
+        if download_name:
+            response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                                 filename=download_name)
+    else:
+        response = send_from_directory(upload_folder, filename, conditional=True, max_age=UPLOAD_MAX_AGE,
+                                       as_attachment=as_attachment, download_name=download_name)
+    response.cache_control.max_age = UPLOAD_MAX_AGE
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def pdf_folder():
+    """Where PDFs are stored, once per distinct content, named by their SHA-256."""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'pdfs')
+
+@bp.app_template_global()
+def media_url(path):
+    """URL for a stored image/video/PDF path: Cloudinary URL, upload or static file."""
+    if path.startswith('http'):
+        return path
+    if path.startswith('uploads/'):
+        return url_for('main.uploaded_file', filename=path[len('uploads/'):])
+    return url_for('static', filename=path)
+
+def highlight(snippet):
+    """Escape a ts_headline snippet and turn its match markers into <mark> tags."""
+    text = str(escape(snippet or ''))
+    return Markup(text.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>'))
+
+def reconcile_topics(cur, course_id, headings):
+    """Make a course's topics match ``headings`` in one statement.
+
+    Existing topics keep their id and content: they are matched by heading
+    first (reorders), then by position (renames). Unmatched old topics are
+    deleted and unmatched headings inserted with empty content. The
+    topic-order unique constraint is deferred, so the shuffle is safe.
+    """
+    cur.execute('''
+        WITH new AS (
+            SELECT heading, ord - 1 AS topic_index,
+                   ROW_NUMBER() OVER (PARTITION BY heading ORDER BY ord) AS dup
+            FROM unnest(%(headings)s::text[]) WITH ORDINALITY AS n(heading, ord)
+        ),
+        old AS (
+            SELECT id, heading, topic_index,
+                   ROW_NUMBER() OVER (PARTITION BY heading ORDER BY topic_index, id) AS dup
+            FROM topics WHERE course_id = %(course_id)s
+        ),
+        by_heading AS (
+            SELECT o.id, n.topic_index, n.heading
+            FROM new n JOIN old o ON o.heading = n.heading AND o.dup = n.dup
+        ),
+        by_position AS (
+            SELECT o.id, n.topic_index, n.heading
+            FROM new n JOIN old o ON o.topic_index = n.topic_index
+            WHERE NOT EXISTS (SELECT 1 FROM by_heading b WHERE b.topic_index = n.topic_index OR b.id = o.id)
+        ),
+        matched AS (
+            SELECT * FROM by_heading UNION ALL SELECT * FROM by_position
+        ),
+        removed AS (
+            DELETE FROM topics t
+            WHERE t.course_id = %(course_id)s AND NOT EXISTS (SELECT 1 FROM matched m WHERE m.id = t.id)
+        ),
+        moved AS (
+            UPDATE topics t SET topic_index = m.topic_index, heading = m.heading,
+                version = t.version + 1, updated_at = NOW() AT TIME ZONE 'utc'
+            FROM matched m
+            WHERE t.id = m.id AND (t.topic_index, t.heading) IS DISTINCT FROM (m.topic_index, m.heading)
+        )
+        INSERT INTO topics (course_id, topic_index, heading, content)
+        SELECT %(course_id)s, n.topic_index, n.heading, ''
+        FROM new n
+        WHERE NOT EXISTS (SELECT 1 FROM matched m WHERE m.topic_index = n.topic_index)
+    ''', {'course_id': course_id, 'headings': list(headings)})
+
+def parse_grades(entries):
+    """Validate grading entries; returns (rows, errors) with rows as (id, feedback, grade)."""
+    rows, errors = [], []
+    for i, entry in enumerate(entries):
+        try:
+            submission_id = int(entry['submission_id'])
+            grade = int(entry['grade'])
+            feedback = str(entry['feedback']).strip()
+        except (KeyError, TypeError, ValueError):
+            errors.append({'index': i, 'error': 'submission_id, feedback and an integer grade are required'})
+            continue
+        if not 0 <= grade <= 100 or not feedback:
+            errors.append({'index': i, 'submission_id': submission_id, 'error': 'grade must be 0-100 with feedback'})
+            continue
+        rows.append((submission_id, feedback, grade))
+    return rows, errors
+
+def grader_token():
+    """Identifies this session's grading claims, so graders sharing an account don't collide."""
+    if 'grader_token' not in session:
+        session['grader_token'] = secrets.token_hex(8)
+    return session['grader_token']
+
+def apply_grades(cur, rows, instructor_id, claim_token):
+    """Grade many submissions with one batched UPDATE; returns the graded ids.
+
+    Submissions in courses the instructor does not own, already graded, or
+    claimed by another grader's unexpired claim are left untouched.
+    """
+    if not rows:
+        return []
+    graded = psycopg2.extras.execute_values(cur, '''
+        UPDATE submissions s SET feedback = v.feedback, grade = v.grade, graded_by = v.graded_by,
+            claim_token = NULL, claimed_until = NULL
+        FROM (VALUES %s) AS v(id, feedback, grade, graded_by, claim_token)
+        JOIN courses c ON c.instructor_id = v.graded_by
+        WHERE s.id = v.id AND s.course_id = c.id AND s.feedback IS NULL
+        AND (s.claim_token IS NULL OR s.claim_token = v.claim_token
+             OR s.claimed_until < NOW() AT TIME ZONE 'utc')
+        RETURNING s.id
+    ''', [(sid, feedback, grade, instructor_id, claim_token) for sid, feedback, grade in rows],
+        template='(%s::int, %s::text, %s::int, %s::int, %s::text)', fetch=True)
+    return [row[0] for row in graded]
+
+def load_instructor_courses(cur, instructor_id):
+    """The instructor's courses with their headline stats from the trigger-maintained summaries."""
+    cur.execute('''
+        SELECT c.*,
+               COALESCE(s.enrollments, 0) AS enrollment_count,
+               COALESCE(s.submissions - s.graded, 0) AS pending_count,
+               ROUND(s.grade_sum::numeric / NULLIF(s.graded, 0), 1) AS average_grade,
+               (SELECT COALESCE(SUM(p.students), 0) FROM course_progress_stats p
+                WHERE p.course_id = c.id
+                AND p.milestones >= 1 + (SELECT COUNT(*) FROM topics t WHERE t.course_id = c.id)) AS completed_count
+        FROM courses c LEFT JOIN course_stats s ON s.course_id = c.id
+        WHERE c.instructor_id = %s
+    ''', (instructor_id,))
+    return cur.fetchall()
+
+def load_course_analytics(cur, course_id):
+    """Enrollment, progress and grade summaries of a course; no scans of per-student rows."""
+    cur.execute('SELECT * FROM course_stats WHERE course_id = %s', (course_id,))
+    stats = cur.fetchone()
+    stats = dict(stats) if stats else {'enrollments': 0, 'submissions': 0, 'graded': 0, 'grade_sum': 0}
+    stats['average_grade'] = round(stats['grade_sum'] / stats['graded'], 1) if stats['graded'] else None
+    # Drop-off: how many students reached each topic, in course order
+    cur.execute('''
+        SELECT t.topic_index, t.heading, COALESCE(m.students, 0) AS students
+        FROM topics t
+        LEFT JOIN course_milestone_stats m ON m.course_id = t.course_id AND m.milestone = t.heading
+        WHERE t.course_id = %s ORDER BY t.topic_index
+    ''', (course_id,))
+    topics = cur.fetchall()
+    cur.execute('''
+        SELECT students FROM course_milestone_stats WHERE course_id = %s AND milestone = 'Assignment Submitted'
+    ''', (course_id,))
+    row = cur.fetchone()
+    stats['assignment_submitted'] = row['students'] if row else 0
+    cur.execute('''
+        SELECT milestones, students FROM course_progress_stats
+        WHERE course_id = %s AND students > 0 ORDER BY milestones
+    ''', (course_id,))
+    progress = cur.fetchall()
+    total_milestones = 1 + len(topics)
+    stats['completed'] = sum(p['students'] for p in progress if p['milestones'] >= total_milestones)
+    cur.execute('SELECT bucket, submissions FROM course_grade_stats WHERE course_id = %s', (course_id,))
+    buckets = {row['bucket']: row['submissions'] for row in cur.fetchall()}
+    grades = [{'label': f'{b * 10}-{b * 10 + 9}' if b < 9 else '90-100', 'submissions': buckets.get(b, 0)}
+              for b in range(10)]
+    return stats, topics, progress, grades, total_milestones
+
+def claim_grading_batch(cur, instructor_id, claim_token):
+    """Claim (or renew) up to GRADING_BATCH_SIZE of the oldest pending submissions.
+
+    Rows another grader is claiming right now are skipped rather than waited
+    for (SKIP LOCKED), and rows under another grader's unexpired claim are
+    left out, so concurrent graders always get disjoint batches. The claim
+    takes effect when the caller commits.
+    """
+    cur.execute('''
+        WITH claimable AS (
+            SELECT s.id FROM submissions s JOIN courses c ON s.course_id = c.id
+            WHERE c.instructor_id = %(instructor)s AND s.feedback IS NULL
+            AND (s.claim_token IS NULL OR s.claim_token = %(token)s
+                 OR s.claimed_until < NOW() AT TIME ZONE 'utc')
+            ORDER BY s.submitted_at, s.id
+            LIMIT %(size)s
+            FOR UPDATE OF s SKIP LOCKED
+        )
+        UPDATE submissions s SET claim_token = %(token)s,
+            claimed_until = NOW() AT TIME ZONE 'utc' + %(ttl)s * INTERVAL '1 second'
+        FROM claimable q, users u, courses c
+        WHERE s.id = q.id AND u.id = s.user_id AND c.id = s.course_id
+        RETURNING s.id, s.user_id, s.course_id, s.submission_text, s.submitted_at, s.feedback, s.grade,
+            s.claimed_until, u.firstname || ' ' || u.lastname AS student_name, c.title AS course_title
+    ''', {'instructor': instructor_id, 'token': claim_token, 'size': GRADING_BATCH_SIZE, 'ttl': GRADING_CLAIM_TTL})
+    return sorted(cur.fetchall(), key=lambda s: (s['submitted_at'], s['id']))
+
+def get_milestones(cur, user_id, course_id):
+    cur.execute('SELECT milestone FROM enrollment_milestones WHERE user_id = %s AND course_id = %s',
+               (user_id, course_id))
+    return {row[0] for row in cur.fetchall()}
+
+# Uploads over the request's size limit
+@bp.app_errorhandler(413)
+def request_too_large(error):
+    flash('The uploaded file is too large.', 'danger')
+    return redirect(request.url)
+
 # Filter for formatting datetime
-@app.template_filter('datetimeformat')
+@bp.app_template_filter('datetimeformat')
 def datetimeformat(value, format='%Y-%m-%d %H:%M'):
     if value == 'now':
         return datetime.now().strftime(format)
@@ -65,31 +580,35 @@ def datetimeformat(value, format='%Y-%m-%d %H:%M'):
 
 
 # PDF Management
-@app.route('/pdfs')
+@bp.route('/pdfs')
 def list_pdfs():
-    db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("""
+    db = get_read_db()
+    cur = db.cursor()
+    pdfs, page = fetch_page(cur, """
         SELECT p.id, p.filename, p.file_path, p.uploaded_at,
                u.firstname || ' ' || u.lastname AS uploader,
                c.title AS course_title
         FROM pdf_resources p
         LEFT JOIN users u ON p.uploaded_by = u.id
         LEFT JOIN courses c ON p.course_id = c.id
-        ORDER BY p.uploaded_at DESC
-    """)
-    pdfs = cur.fetchall()
+        WHERE TRUE {where}
+        ORDER BY {order}
+    """, (), ('p.uploaded_at', 'p.id'))
     cur.close()
-    return render_template("list_pdfs.html", pdfs=pdfs, role=session.get("role", "student"))
+    return render_template("list_pdfs.html", pdfs=pdfs, page=page, role=session.get("role", "student"))
 
-@app.route('/upload-pdf', methods=['GET', 'POST'])
+@bp.route('/upload-pdf', methods=['GET', 'POST'])
 def upload_pdf():
-    if 'user_id' not in session or session['role'] != 'instructor':
+    if not g.user or g.user['role'] != 'instructor':
         flash("Unauthorized", "danger")
-        return redirect(url_for("list_pdfs"))
+        return redirect(url_for("main.list_pdfs"))
+
+    if request.method == 'POST':
+        # Oversized bodies are rejected while parsing, before they are spooled
+        request.max_content_length = PDF_MAX_SIZE + 64 * 1024
 
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur = db.cursor()
     cur.execute("SELECT id, title FROM courses")
     courses = cur.fetchall()
 
@@ -99,30 +618,57 @@ def upload_pdf():
 
         if not pdf_file or not course_id:
             flash("Course and PDF required", "danger")
-            return redirect(url_for("upload_pdf"))
+            return redirect(url_for("main.upload_pdf"))
 
         filename = secure_filename(pdf_file.filename)
-        unique_name = f"{secrets.token_hex(8)}_{filename}"
-        local_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-        pdf_file.save(local_path)
-        file_url = os.path.join('uploads', unique_name).replace('\\', '/')
-
-        cur.execute("""
-            INSERT INTO pdf_resources (filename, file_path, uploaded_by, uploaded_at, course_id)
-            VALUES (%s, %s, %s, NOW(), %s)
-        """, (filename, file_url, session['user_id'], course_id))
-        db.commit()
+        try:
+            digest, size, temp_path = spool_pdf(pdf_file.stream, pdf_folder())
+        except PDFRejected as e:
+            flash(str(e), "danger")
+            return redirect(url_for("main.upload_pdf"))
+        file_url = f"uploads/pdfs/{blob_filename(digest)}"
+        blob_path = os.path.join(pdf_folder(), blob_filename(digest))
+        created_blob = False
+
+        try:
+            cur.execute("""
+                INSERT INTO pdf_blobs (sha256, file_path, size, ref_count) VALUES (%s, %s, %s, 1)
+                ON CONFLICT (sha256) DO UPDATE SET ref_count = pdf_blobs.ref_count + 1
+                RETURNING ref_count
+            """, (digest, file_url, size))
+            created_blob = cur.fetchone()['ref_count'] == 1
+            # Moved into place while the blob row is locked, so a concurrent
+            # delete of the last reference cannot remove it underneath us
+            os.replace(temp_path, blob_path)
+            cur.execute("""
+                INSERT INTO pdf_resources (filename, file_path, uploaded_by, uploaded_at, course_id, sha256)
+                VALUES (%s, %s, %s, NOW(), %s, %s)
+            """, (filename, file_url, g.user['id'], course_id, digest))
+            db.commit()
+        except psycopg2.Error:
+            # A blob this upload created has no other reference once rolled
+            # back; remove it while the row lock still keeps others waiting
+            if created_blob and not os.path.exists(temp_path):
+                try:
+                    os.remove(blob_path)
+                except OSError:
+                    pass
+            db.rollback()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            flash("Failed to upload PDF", "danger")
+            return redirect(url_for("main.upload_pdf"))
 
         flash("PDF uploaded successfully!", "success")
-        return redirect(url_for("list_pdfs"))
+        return redirect(url_for("main.list_pdfs"))
 
     cur.close()
     return render_template("upload_pdf.html", courses=courses)
 
-@app.route('/view-pdf/<int:pdf_id>')
+@bp.route('/view-pdf/<int:pdf_id>')
 def view_pdf(pdf_id):
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur = db.cursor()
     cur.execute("SELECT file_path, filename FROM pdf_resources WHERE id = %s", (pdf_id,))
     pdf = cur.fetchone()
     cur.close()
@@ -131,12 +677,14 @@ def view_pdf(pdf_id):
         abort(404)
 
     # Redirect to Cloudinary URL
-    return redirect(pdf['file_path'])
+    if pdf['file_path'].startswith('http'):
+        return redirect(pdf['file_path'])
+    return serve_upload(pdf['file_path'][len('uploads/'):], download_name=pdf['filename'])
 
-@app.route('/download-pdf/<int:pdf_id>')
+@bp.route('/download-pdf/<int:pdf_id>')
 def download_pdf(pdf_id):
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur = db.cursor()
     cur.execute("SELECT file_path, filename FROM pdf_resources WHERE id = %s", (pdf_id,))
     pdf = cur.fetchone()
     cur.close()
@@ -145,64 +693,148 @@ def download_pdf(pdf_id):
         abort(404)
 
     # Cloudinary handles downloads via the URL
-    return redirect(pdf['file_path'])
+    if pdf['file_path'].startswith('http'):
+        return redirect(pdf['file_path'])
+    return serve_upload(pdf['file_path'][len('uploads/'):], download_name=pdf['filename'], as_attachment=True)
 
-@app.route('/delete-pdf/<int:pdf_id>', methods=['POST'])
+@bp.route('/delete-pdf/<int:pdf_id>', methods=['POST'])
 def delete_pdf(pdf_id):
-    if 'user_id' not in session or session['role'] != 'instructor':
+    if not g.user or g.user['role'] != 'instructor':
         flash("Unauthorized", "danger")
-        return redirect(url_for("list_pdfs"))
+        return redirect(url_for("main.list_pdfs"))
 
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT file_path FROM pdf_resources WHERE id = %s", (pdf_id,))
+    cur = db.cursor()
+    cur.execute("SELECT file_path, sha256 FROM pdf_resources WHERE id = %s", (pdf_id,))
     pdf = cur.fetchone()
 
     if not pdf:
         flash("PDF not found", "danger")
-        return redirect(url_for("list_pdfs"))
+        return redirect(url_for("main.list_pdfs"))
+
+    # Content-addressed blobs are shared; remove the file with the last reference
+    if pdf['sha256']:
+        cur.execute("UPDATE pdf_blobs SET ref_count = ref_count - 1 WHERE sha256 = %s RETURNING ref_count",
+                    (pdf['sha256'],))
+        blob = cur.fetchone()
+        cur.execute("DELETE FROM pdf_resources WHERE id = %s", (pdf_id,))
+        db.commit()
+        # Files go only after the references are committed. The file is
+        # removed while the blob row's delete holds its lock, so a concurrent
+        # upload of the same content waits and then moves the file back.
+        if blob and blob['ref_count'] <= 0:
+            cur.execute("DELETE FROM pdf_blobs WHERE sha256 = %s AND ref_count <= 0 RETURNING sha256",
+                        (pdf['sha256'],))
+            if cur.fetchone():
+                try:
+                    os.remove(os.path.join(pdf_folder(), blob_filename(pdf['sha256'])))
+                except OSError:
+                    pass
+            db.commit()
+        cur.close()
+        flash("PDF deleted successfully", "success")
+        return redirect(url_for("main.list_pdfs"))
+
+    cur.execute("DELETE FROM pdf_resources WHERE id = %s", (pdf_id,))
+    db.commit()
+    cur.close()
 
     # Only delete from Cloudinary if the file_path is a Cloudinary URL
     if pdf['file_path'] and pdf['file_path'].startswith('http'):
         public_id = pdf['file_path'].split('/')[-1].split('.')[0]  # Extract public_id
-        cloudinary.uploader.destroy(public_id, resource_type="raw")
+        cloudinary_uploader().destroy(public_id, resource_type="raw")
     # If stored locally, remove the file from the uploads folder
     elif pdf['file_path'] and pdf['file_path'].startswith('uploads/'):
-        local_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf['file_path'].split('/')[-1])
+        local_path = os.path.join(current_app.config['UPLOAD_FOLDER'], pdf['file_path'][len('uploads/'):])
         try:
             os.remove(local_path)
         except OSError:
             pass
 
-    cur.execute("DELETE FROM pdf_resources WHERE id = %s", (pdf_id,))
-    db.commit()
-    cur.close()
-
     flash("PDF deleted successfully", "success")
-    return redirect(url_for("list_pdfs"))
+    return redirect(url_for("main.list_pdfs"))
+
+# Locally stored uploads (PDFs, course images and videos)
+@bp.route('/files/<path:filename>')
+def uploaded_file(filename):
+    return serve_upload(filename)
+
+# Prometheus metrics for this worker process
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        abort(403)
+    pool = pool_stats()
+    cache = catalog_cache.stats()
+    gauges = {
+        'eduverse_db_pool_size': ('Open pooled connections.', pool.get('size', 0)),
+        'eduverse_db_pool_in_use': ('Pooled connections checked out.', pool.get('in_use', 0)),
+        'eduverse_db_pool_idle': ('Pooled connections idle.', pool.get('idle', 0)),
+        'eduverse_db_pool_timeouts': ('Checkouts that timed out.', pool.get('timeouts', 0)),
+        'eduverse_db_pool_avg_wait_seconds': ('Average wait for a pooled connection.', pool.get('avg_wait', 0.0)),
+        'eduverse_db_pool_max_wait_seconds': ('Longest wait for a pooled connection.', pool.get('max_wait', 0.0)),
+        'eduverse_db_fallback_active': ('1 while the local fallback database is in use.',
+                                        int(db_backend_state()['active'] == 'local')),
+        'eduverse_db_replicas_healthy': ('Read replicas currently in rotation.',
+                                         sum(r['healthy'] for r in replica_state())),
+        'eduverse_catalog_cache_hits': ('Catalog cache hits.', cache['hits']),
+        'eduverse_catalog_cache_misses': ('Catalog cache misses.', cache['misses']),
+        'eduverse_catalog_cache_size': ('Catalog cache entries.', cache['size']),
+    }
+    return current_app.response_class(metrics.registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# Slowest profiled requests, with links to their collapsed stacks
+@bp.route('/admin/profiles')
+def list_profiles():
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
+    return render_template('profiles.html', profiles=profiler.captured()[:100], enabled=profiler.enabled,
+                           sample_rate=profiler.sample_rate)
+
+@bp.route('/admin/profiles/<profile_id>.folded')
+def download_profile(profile_id):
+    if not g.user or g.user['role'] != 'instructor':
+        abort(403)
+    path = profiler.folded_path(profile_id)
+    if path is None:
+        abort(404)
+    return send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True,
+                     download_name=f'{profile_id}.folded')
 
 # home page
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
 # User profile page
-@app.route('/profile')
+@bp.route('/profile', methods=['GET', 'POST'])
 def profile():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT * FROM users WHERE id = %s', (session['user_id'],))
-    user = cur.fetchone()
-    cur.close()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('index'))
-    return render_template('profile.html', user=user)
+    if not g.user:
+        return redirect(url_for('main.login'))
+    if request.method == 'POST':
+        firstname = request.form.get('firstname', '').strip()
+        lastname = request.form.get('lastname', '').strip()
+        if not firstname or not lastname:
+            flash('First and last name are required.', 'error')
+            return redirect(url_for('main.profile'))
+        db = get_db()
+        cur = db.cursor()
+        cur.execute(f'''
+            UPDATE users SET firstname = %s, lastname = %s, version = version + 1
+            WHERE id = %s RETURNING {USER_COLUMNS}
+        ''', (firstname, lastname, g.user['id']))
+        user = dict(cur.fetchone())
+        db.commit()
+        cur.close()
+        user_updated(user)
+        flash('Profile updated.', 'success')
+        return redirect(url_for('main.profile'))
+    return render_template('profile.html', user=g.user)
 
 # User registration
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         firstname = request.form['firstname']
@@ -220,7 +852,7 @@ def register():
             )
             db.commit()
             flash('Registration successful! Please log in.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         except psycopg2.IntegrityError:
             db.rollback()
             flash('User already exists.', 'error')
@@ -234,205 +866,232 @@ def register():
 
 
 # User login
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
         db = get_db()
-        cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute('SELECT * FROM users WHERE email = %s', (email,))
+        cur = db.cursor()
+        cur.execute(f'SELECT {USER_COLUMNS}, password FROM users WHERE email = %s', (email,))
         user = cur.fetchone()
         cur.close()
         if user and check_password_hash(user['password'], password):
             session['user_id'] = user['id']
             session['email'] = user['email']
             session['role'] = user['role']
+            session['user_version'] = user['version']
+            user_cache.set(user['id'], {k: v for k, v in user.items() if k != 'password'})
             if user['role'] == 'instructor':
-                return redirect(url_for('instructor_dashboard'))
-            return redirect(url_for('student_dashboard'))
+                return redirect(url_for('main.instructor_dashboard'))
+            return redirect(url_for('main.student_dashboard'))
         flash('Invalid credentials.', 'error')
     return render_template('login.html')
 
 # User logout
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.clear()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 # Student dashboard
-@app.route('/student_dashboard')
+@bp.route('/student_dashboard')
 def student_dashboard():
-    if 'user_id' not in session or session['role'] != 'student':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT * FROM users WHERE id = %s', (session['user_id'],))
-    user = cur.fetchone()
-    cur.execute('SELECT c.id, c.title, c.image_path, e.milestones FROM courses c INNER JOIN enrollments e ON c.id = e.course_id WHERE e.user_id = %s', (session['user_id'],))
+    cur = db.cursor()
+    cur.execute('''
+        SELECT c.id, c.title, c.image_path,
+               (SELECT COUNT(*) FROM topics t WHERE t.course_id = c.id) AS topic_count,
+               e.milestone_count
+        FROM courses c INNER JOIN enrollments e ON c.id = e.course_id WHERE e.user_id = %s
+    ''', (g.user['id'],))
     enrolled_courses = cur.fetchall()
     progress_data = {}
     for course in enrolled_courses:
-        milestones = set(course['milestones'].split(',') if course['milestones'] else [])
-        cur.execute('SELECT heading FROM topics WHERE course_id = %s ORDER BY topic_index', (course['id'],))
-        topics = cur.fetchall()
-        total_milestones = 1 + len(topics)
-        progress = (len(milestones) / total_milestones) * 100 if total_milestones > 0 else 0
+        total_milestones = 1 + course['topic_count']
+        progress = (course['milestone_count'] / total_milestones) * 100 if total_milestones > 0 else 0
         progress_data[course['id']] = {
             'title': course['title'],
             'progress': progress,
             'image_path': course['image_path']
         }
     cur.close()
-    return render_template('student_dashboard.html', user=user, progress_data=progress_data)
+    return render_template('student_dashboard.html', user=g.user, progress_data=progress_data)
 
 # View student submissions
-@app.route('/submissions')
+@bp.route('/submissions')
 def submissions():
-    if 'user_id' not in session or session['role'] != 'student':
-        return redirect(url_for('index'))
-    db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT s.*, c.title AS course_title FROM submissions s JOIN courses c ON s.course_id = c.id WHERE s.user_id = %s', (session['user_id'],))
-    submissions = cur.fetchall()
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
+    db = get_read_db()
+    cur = db.cursor()
+    submissions, page = fetch_page(cur, '''
+        SELECT s.*, c.title AS course_title FROM submissions s JOIN courses c ON s.course_id = c.id
+        WHERE s.user_id = %s {where}
+        ORDER BY {order}
+    ''', (g.user['id'],), ('s.submitted_at', 's.id'))
     cur.close()
-    return render_template('submissions.html', submissions=submissions)
+    return render_template('submissions.html', submissions=submissions, page=page)
 
 # List available courses
-@app.route('/courses')
+@bp.route('/courses')
 def courses():
-    if 'user_id' not in session or session['role'] != 'student':
-        return redirect(url_for('index'))
-    db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT * FROM courses')
-    courses = cur.fetchall()
-    cur.execute('SELECT course_id, milestones FROM enrollments WHERE user_id = %s', (session['user_id'],))
-    enrolled_courses = cur.fetchall()
-    enrolled_milestones = {c['course_id']: c['milestones'].split(',') if c['milestones'] else [] for c in enrolled_courses}
-    topics = {}
-    for course in courses:
-        cur.execute('SELECT heading FROM topics WHERE course_id = %s ORDER BY topic_index', (course['id'],))
-        topics[course['id']] = [t['heading'] for t in cur.fetchall()]
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
+    db = get_read_db()
+    cur = db.cursor()
+    catalog = load_catalog(cur)
+    # Only this student's enrollment state comes from the database
+    cur.execute('''
+        SELECT e.course_id, e.milestone_count FROM enrollments e WHERE e.user_id = %s
+    ''', (g.user['id'],))
+    enrolled = {e['course_id']: e['milestone_count'] for e in cur.fetchall()}
     cur.close()
-    return render_template('courses.html', courses=courses, enrolled_milestones=enrolled_milestones, topics=topics)
+    courses = [dict(c, enrolled=c['id'] in enrolled, milestone_count=enrolled.get(c['id'], 0)) for c in catalog]
+    return render_template('courses.html', courses=courses)
 
 # Course detail page
-@app.route('/course/<int:course_id>')
+@bp.route('/course/<int:course_id>')
 def course_detail(course_id):
-    if 'user_id' not in session or session['role'] != 'student':
-        return redirect(url_for('index'))
-    db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT * FROM courses WHERE id = %s', (course_id,))
-    course = cur.fetchone()
-    cur.execute('SELECT milestones FROM enrollments WHERE user_id = %s AND course_id = %s', (session['user_id'], course_id))
-    enrollment = cur.fetchone()
-    milestones = enrollment['milestones'].split(',') if enrollment and enrollment['milestones'] else []
-    cur.execute('SELECT heading FROM topics WHERE course_id = %s ORDER BY topic_index', (course_id,))
-    topics = [t['heading'] for t in cur.fetchall()]
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
+    db = get_read_db()
+    cur = db.cursor()
+    course = load_course(cur, course_id)
+    milestones = get_milestones(cur, g.user['id'], course_id)
+    topics = [t['heading'] for t in load_topics(cur, course_id)]
     total_milestones = 1 + len(topics)
     progress = (len(milestones) / total_milestones) * 100 if total_milestones > 0 else 0
     cur.close()
-    return render_template('course_detail.html', course=course, milestones=milestones, progress=progress, topics=topics)
+    if not course:
+        return render_template('course_detail.html', course=course, milestones=milestones, progress=progress, topics=topics)
+    return render_conditional((course['id'], course['version'], sorted(milestones)), 'course_detail.html',
+                              course=course, milestones=milestones, progress=progress, topics=topics)
 
 # Topic page for a course
-@app.route('/course/<int:course_id>/topic/<int:topic_index>')
+@bp.route('/course/<int:course_id>/topic/<int:topic_index>')
 def topic_page(course_id, topic_index):
-    if 'user_id' not in session or session['role'] != 'student':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT * FROM courses WHERE id = %s', (course_id,))
-    course = cur.fetchone()
-    cur.execute('SELECT milestones FROM enrollments WHERE user_id = %s AND course_id = %s', (session['user_id'], course_id))
-    enrollment = cur.fetchone()
-    milestones = set(enrollment['milestones'].split(',') if enrollment and enrollment['milestones'] else [])
-    cur.execute('SELECT heading, content FROM topics WHERE course_id = %s AND topic_index = %s', (course_id, topic_index))
-    topic = cur.fetchone()
+    cur = db.cursor()
+    course = load_course(cur, course_id)
+    milestones = get_milestones(cur, g.user['id'], course_id)
+    topics = load_topics(cur, course_id) if course else []
+    topic = next((t for t in topics if t['topic_index'] == topic_index), None)
     if not course or not topic:
         cur.close()
         flash('Invalid topic selection.', 'error')
-        return redirect(url_for('course_detail', course_id=course_id))
+        return redirect(url_for('main.course_detail', course_id=course_id))
     current_topic = topic['heading']
     topic_content = topic['content'] or 'No content available for this topic.'
-    cur.execute('SELECT heading FROM topics WHERE course_id = %s ORDER BY topic_index', (course_id,))
-    topics = [t['heading'] for t in cur.fetchall()]
     next_index = topic_index + 1 if topic_index + 1 < len(topics) else None
     if current_topic not in milestones:
         milestones.add(current_topic)
-        cur.execute('UPDATE enrollments SET milestones = %s WHERE user_id = %s AND course_id = %s',
-                   (','.join(milestones), session['user_id'], course_id))
+        record_milestone(cur, g.user['id'], course_id, current_topic)
         db.commit()
     cur.close()
-    return render_template('topic.html', course=course, topic=current_topic, topic_content=topic_content,
-                           topic_index=topic_index, next_index=next_index, milestones=milestones, course_id=course_id)
+    return render_conditional((course['id'], course['version'], topic['id'], topic['version']), 'topic.html',
+                              last_modified=max(course['updated_at'], topic['updated_at']),
+                              course=course, topic=current_topic, topic_content=topic_content,
+                              topic_index=topic_index, next_index=next_index, milestones=milestones, course_id=course_id)
+
+# Full-text search over courses and topic content
+@bp.route('/search')
+def search():
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
+    query = request.args.get('q', '').strip()
+    page = max(1, min(request.args.get('page', 1, type=int), SEARCH_MAX_PAGES))
+    results = []
+    if query:
+        db = get_read_db()
+        cur = db.cursor()
+        # Rank with the GIN indexes first; headlines only for the page shown
+        cur.execute('''
+            WITH q AS (SELECT websearch_to_tsquery('english', %(query)s) AS query),
+            hits AS (
+                SELECT 'course' AS kind, c.id AS course_id, NULL::int AS topic_index, NULL::int AS topic_id,
+                       c.title AS course_title, c.title AS title, ts_rank(c.search_vector, q.query) AS rank
+                FROM courses c, q WHERE c.search_vector @@ q.query
+                UNION ALL
+                SELECT 'topic', t.course_id, t.topic_index, t.id, c.title, t.heading, ts_rank(t.search_vector, q.query)
+                FROM topics t JOIN courses c ON c.id = t.course_id, q WHERE t.search_vector @@ q.query
+                ORDER BY rank DESC, course_id, topic_index NULLS FIRST
+                LIMIT %(limit)s OFFSET %(offset)s
+            )
+            SELECT h.*, ts_headline('english',
+                       CASE WHEN h.kind = 'course' THEN c.description ELSE t.content END, q.query,
+                       %(options)s) AS snippet
+            FROM hits h
+            CROSS JOIN q
+            LEFT JOIN courses c ON h.kind = 'course' AND c.id = h.course_id
+            LEFT JOIN topics t ON t.id = h.topic_id
+            ORDER BY h.rank DESC, h.course_id, h.topic_index NULLS FIRST
+        ''', {
+            'query': query,
+            'limit': SEARCH_PAGE_SIZE + 1,
+            'offset': (page - 1) * SEARCH_PAGE_SIZE,
+            'options': f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}", MaxFragments=2, MaxWords=30, MinWords=10',
+        })
+        results = [dict(r, snippet=highlight(r['snippet'])) for r in cur.fetchall()]
+        cur.close()
+    has_next = len(results) > SEARCH_PAGE_SIZE and page < SEARCH_MAX_PAGES
+    return render_template('search.html', query=query, results=results[:SEARCH_PAGE_SIZE], page=page, has_next=has_next)
 
 # Enroll in a course
-@app.route('/enroll/<int:course_id>')
+@bp.route('/enroll/<int:course_id>')
 def enroll(course_id):
-    if 'user_id' not in session or session['role'] != 'student':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
     db = get_db()
     cur = db.cursor()
     try:
-        cur.execute('INSERT INTO enrollments (user_id, course_id, milestones) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING',
-                   (session['user_id'], course_id, ''))
+        cur.execute('INSERT INTO enrollments (user_id, course_id) VALUES (%s, %s) ON CONFLICT DO NOTHING',
+                   (g.user['id'], course_id))
         db.commit()
     except psycopg2.Error:
         db.rollback()
     finally:
         cur.close()
-    return redirect(url_for('topic_page', course_id=course_id, topic_index=0))
+    return redirect(url_for('main.topic_page', course_id=course_id, topic_index=0))
 
 # Update course milestone
-@app.route('/update_milestone/<int:course_id>/<string:milestone>', methods=['POST'])
+@bp.route('/update_milestone/<int:course_id>/<string:milestone>', methods=['POST'])
 def update_milestone(course_id, milestone):
-    if 'user_id' not in session or session['role'] != 'student':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
     db = get_db()
     cur = db.cursor()
-    cur.execute('SELECT milestones FROM enrollments WHERE user_id = %s AND course_id = %s', (session['user_id'], course_id))
-    enrollment = cur.fetchone()
-    milestones = set(enrollment[0].split(',') if enrollment and enrollment[0] else [])
-    if milestone not in milestones:
-        milestones.add(milestone)
-        cur.execute('UPDATE enrollments SET milestones = %s WHERE user_id = %s AND course_id = %s',
-                   (','.join(milestones), session['user_id'], course_id))
-        db.commit()
+    record_milestone(cur, g.user['id'], course_id, milestone)
+    db.commit()
     cur.close()
-    return redirect(url_for('course_detail', course_id=course_id))
+    return redirect(url_for('main.course_detail', course_id=course_id))
 
 # Submit course assignment
-@app.route('/assignment/<int:course_id>', methods=['GET', 'POST'])
+@bp.route('/assignment/<int:course_id>', methods=['GET', 'POST'])
 def assignment(course_id):
-    if 'user_id' not in session or session['role'] != 'student':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'student':
+        return redirect(url_for('main.index'))
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT * FROM courses WHERE id = %s', (course_id,))
-    course = cur.fetchone()
+    cur = db.cursor()
+    course = load_course(cur, course_id)
     if not course:
         cur.close()
         flash('Course not found.', 'error')
-        return redirect(url_for('student_dashboard'))
+        return redirect(url_for('main.student_dashboard'))
     if request.method == 'POST':
         submission = request.form['submission']
         try:
             cur.execute('INSERT INTO submissions (user_id, course_id, submission_text) VALUES (%s, %s, %s)',
-                       (session['user_id'], course_id, submission))
-            cur.execute('SELECT milestones FROM enrollments WHERE user_id = %s AND course_id = %s',
-                                    (session['user_id'], course_id))
-            enrollment = cur.fetchone()
-            milestones = set(enrollment['milestones'].split(',') if enrollment and enrollment['milestones'] else [])
-            if 'Assignment Submitted' not in milestones:
-                milestones.add('Assignment Submitted')
-                cur.execute('UPDATE enrollments SET milestones = %s WHERE user_id = %s AND course_id = %s',
-                           (','.join(milestones), session['user_id'], course_id))
+                       (g.user['id'], course_id, submission))
+            record_milestone(cur, g.user['id'], course_id, 'Assignment Submitted')
             db.commit()
             flash('Assignment submitted for review!', 'success')
             cur.close()
-            return redirect(url_for('course_detail', course_id=course_id))
+            return redirect(url_for('main.course_detail', course_id=course_id))
         except psycopg2.Error:
             db.rollback()
             flash('Failed to submit assignment.', 'error')
@@ -440,105 +1099,130 @@ def assignment(course_id):
     return render_template('assignment.html', course_id=course_id, course=course)
 
 # Instructor dashboard
-@app.route('/instructor_dashboard', methods=['GET', 'POST'])
+@bp.route('/instructor_dashboard', methods=['GET', 'POST'])
 def instructor_dashboard():
-    if 'user_id' not in session or session['role'] != 'instructor':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
+    # Uploads lost with a restarted worker would otherwise show as pending forever
+    media_uploader.check_stale()
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur = db.cursor()
     if request.method == 'POST':
         if 'submission_id' in request.form and 'feedback' in request.form and 'grade' in request.form:
-            submission_id = request.form['submission_id']
-            feedback = request.form['feedback']
-            grade = request.form['grade']
+            rows, errors = parse_grades([request.form])
             try:
-                cur.execute('UPDATE submissions SET feedback = %s, graded_by = %s, grade = %s WHERE id = %s',
-                           (feedback, session['user_id'], grade, submission_id))
+                if errors or not apply_grades(cur, rows, g.user['id'], grader_token()):
+                    raise ValueError
                 db.commit()
                 flash('Feedback and grade submitted!', 'success')
-            except psycopg2.Error:
+            except (psycopg2.Error, ValueError):
                 db.rollback()
                 flash('Failed to submit feedback.', 'error')
-    cur.execute('SELECT * FROM users WHERE id = %s', (session['user_id'],))
-    user = cur.fetchone()
-    cur.execute('SELECT * FROM courses WHERE instructor_id = %s', (session['user_id'],))
-    courses = cur.fetchall()
-    cur.execute('''
-        SELECT s.id, s.user_id, s.course_id, s.submission_text, s.submitted_at, s.feedback, s.grade,
-        u.firstname || ' ' || u.lastname AS student_name, c.title AS course_title
-        FROM submissions s
-        JOIN users u ON s.user_id = u.id
-        JOIN courses c ON s.course_id = c.id
-        WHERE s.course_id IN (SELECT id FROM courses WHERE instructor_id = %s)
-        AND s.feedback IS NULL
-    ''', (session['user_id'],))
-    submissions = cur.fetchall()
     cur.close()
-    return render_template('instructor_dashboard.html', user=user, courses=courses, submissions=submissions)
+    # Independent queries, each on its own pooled connection; the claim runs
+    # first, on the request's own connection, so it can be committed here
+    instructor_id, token = g.user['id'], grader_token()
+    submissions, courses = run_concurrently(
+        db,
+        lambda c: claim_grading_batch(c, instructor_id, token),
+        lambda c: load_instructor_courses(c, instructor_id),
+    )
+    db.commit()
+    return render_template('instructor_dashboard.html', user=g.user, courses=courses, submissions=submissions,
+                           claim_minutes=GRADING_CLAIM_TTL // 60)
+
+# Per-course analytics, read from the summary tables kept up to date by triggers
+@bp.route('/course/<int:course_id>/analytics')
+def course_analytics(course_id):
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
+    db = get_read_db()
+    cur = db.cursor()
+    course = load_course(cur, course_id)
+    if not course or course['instructor_id'] != g.user['id']:
+        cur.close()
+        flash('Course not found or you do not have permission.', 'error')
+        return redirect(url_for('main.instructor_dashboard'))
+    stats, topics, progress, grades, total_milestones = load_course_analytics(cur, course_id)
+    cur.close()
+    return render_template('course_analytics.html', course=course, stats=stats, topics=topics,
+                           progress=progress, grades=grades, total_milestones=total_milestones)
+
+# Grade many submissions in one request: {"grades": [{"submission_id", "feedback", "grade"}, ...]}
+@bp.route('/grade_submissions', methods=['POST'])
+def grade_submissions():
+    if not g.user or g.user['role'] != 'instructor':
+        return jsonify(error='Unauthorized'), 403
+    payload = request.get_json(silent=True)
+    entries = payload.get('grades') if isinstance(payload, dict) else None
+    if not isinstance(entries, list) or not entries:
+        return jsonify(error='Expected a non-empty "grades" list'), 400
+    rows, errors = parse_grades(entries)
+    if errors:
+        return jsonify(error='Invalid grades', details=errors), 400
+    db = get_db()
+    cur = db.cursor()
+    try:
+        graded = apply_grades(cur, rows, g.user['id'], grader_token())
+        db.commit()
+    except psycopg2.Error:
+        db.rollback()
+        return jsonify(error='Failed to save grades'), 500
+    finally:
+        cur.close()
+    skipped = sorted({row[0] for row in rows} - set(graded))
+    return jsonify(graded=sorted(graded), skipped=skipped)
 
 # Create a new course
-@app.route('/create_course', methods=['GET', 'POST'])
+@bp.route('/create_course', methods=['GET', 'POST'])
 def create_course():
-    if 'user_id' not in session or session['role'] != 'instructor':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
     if request.method == 'POST':
         title = request.form['title']
         description = request.form['description']
         topics = request.form['topics']
-        instructor_id = session['user_id']
+        instructor_id = g.user['id']
         topic_list = [t.strip() for t in topics.split(',') if t.strip()]
-        image_path = None
-        video_path = None
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                unique_filename = f"{secrets.token_hex(8)}_{filename}"
-                upload_result = cloudinary.uploader.upload(
-                    file,
-                    public_id=unique_filename,
-                    resource_type="image",
-                    overwrite=True
-                )
-                image_path = upload_result['secure_url']
-        if 'video' in request.files:
-            file = request.files['video']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                unique_filename = f"{secrets.token_hex(8)}_{filename}"
-                upload_result = cloudinary.uploader.upload(
-                    file,
-                    public_id=unique_filename,
-                    resource_type="video",
-                    overwrite=True
-                )
-                video_path = upload_result['secure_url']
+        media = spool_media()
         db = get_db()
         cur = db.cursor()
         try:
-            cur.execute('INSERT INTO courses (title, description, video_url, video_path, instructor_id, topics, image_path) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id',
-                       (title, description, None, video_path, instructor_id, topics, image_path))
+            cur.execute('''
+                INSERT INTO courses (title, description, video_url, video_path, instructor_id, topics, image_path,
+                                     image_status, video_status, image_pending_since, video_pending_since)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s,
+                        CASE WHEN %s THEN NOW() AT TIME ZONE 'utc' END, CASE WHEN %s THEN NOW() AT TIME ZONE 'utc' END)
+                RETURNING id
+            ''', (title, description, None, None, instructor_id, topics, None,
+                  'pending' if 'image' in media else None, 'pending' if 'video' in media else None,
+                  'image' in media, 'video' in media))
             course_id = cur.fetchone()[0]
-            for index, topic in enumerate(topic_list):
-                cur.execute('INSERT INTO topics (course_id, topic_index, heading, content) VALUES (%s, %s, %s, %s)',
-                           (course_id, index, topic, ''))
+            psycopg2.extras.execute_values(cur, 'INSERT INTO topics (course_id, topic_index, heading, content) VALUES %s',
+                                           [(course_id, index, topic, '') for index, topic in enumerate(topic_list)])
             db.commit()
+            invalidate_course(course_id)
+            for kind, (path, public_id) in media.items():
+                media_uploader.schedule(course_id, kind, path, public_id)
             flash('Course created successfully!', 'success')
             cur.close()
-            return redirect(url_for('instructor_dashboard'))
+            return redirect(url_for('main.instructor_dashboard'))
         except psycopg2.Error:
             db.rollback()
+            for path, _ in media.values():
+                media_uploader.discard(path)
             flash('Failed to create course.', 'error')
     return render_template('create_course.html')
 
 # Manage courses
-@app.route('/manage_courses', methods=['GET', 'POST'])
+@bp.route('/manage_courses', methods=['GET', 'POST'])
 def manage_courses():
-    if 'user_id' not in session or session['role'] != 'instructor':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
+    media_uploader.check_stale()
 
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur = db.cursor()
 
     if request.method == 'POST':
         if 'delete_course' in request.form:
@@ -570,10 +1254,11 @@ def manage_courses():
                 # Finally delete the course itself
                 cur.execute(
                     'DELETE FROM courses WHERE id = %s AND instructor_id = %s',
-                    (course_id, session['user_id'])
+                    (course_id, g.user['id'])
                 )
 
                 db.commit()
+                invalidate_course(course_id)
                 flash('Course deleted!', 'success')
             except psycopg2.Error:
                 db.rollback()
@@ -584,146 +1269,134 @@ def manage_courses():
             description = request.form['description']
             topics = request.form['topics']
             course_id = request.form.get('course_id')
-            instructor_id = session['user_id']
+            instructor_id = g.user['id']
             topic_list = [t.strip() for t in topics.split(',') if t.strip()]
 
-            image_path = None
-            video_path = None
-
-            if 'image' in request.files:
-                file = request.files['image']
-                if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{secrets.token_hex(8)}_{filename}"
-                    upload_result = cloudinary.uploader.upload(
-                        file,
-                        public_id=unique_filename,
-                        resource_type="image",
-                        overwrite=True
-                    )
-                    image_path = upload_result['secure_url']
-
-                    # Remove old image (if it was stored locally)
-                    cur.execute('SELECT image_path FROM courses WHERE id = %s', (course_id,))
-                    old_course = cur.fetchone()
-                    if old_course and old_course['image_path'] and not old_course['image_path'].startswith('http'):
-                        try:
-                            os.remove(os.path.join('static', old_course['image_path']))
-                        except OSError:
-                            pass
-
-            if 'video' in request.files:
-                file = request.files['video']
-                if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{secrets.token_hex(8)}_{filename}"
-                    upload_result = cloudinary.uploader.upload(
-                        file,
-                        public_id=unique_filename,
-                        resource_type="video",
-                        overwrite=True
-                    )
-                    video_path = upload_result['secure_url']
-
-                    # Remove old video (if it was stored locally)
-                    cur.execute('SELECT video_path FROM courses WHERE id = %s', (course_id,))
-                    old_course = cur.fetchone()
-                    if old_course and old_course['video_path'] and not old_course['video_path'].startswith('http'):
-                        try:
-                            os.remove(os.path.join('static', old_course['video_path']))
-                        except OSError:
-                            pass
+            # New media is uploaded in the background; the worker replaces
+            # the old path and removes the old file if it was stored locally
+            media = spool_media()
 
             try:
                 update_query = '''
                     UPDATE courses 
-                    SET title = %s, description = %s, video_url = %s, instructor_id = %s, topics = %s
+                    SET title = %s, description = %s, video_url = %s, instructor_id = %s, topics = %s,
+                        version = version + 1, updated_at = NOW() AT TIME ZONE 'utc'
                 '''
                 params = [title, description, None, instructor_id, topics]
 
-                if image_path:
-                    update_query += ', image_path = %s'
-                    params.append(image_path)
-                if video_path:
-                    update_query += ', video_path = %s'
-                    params.append(video_path)
+                for kind in media:
+                    _, status_column, since_column = MEDIA_COLUMNS[kind]
+                    update_query += f", {status_column} = 'pending', {since_column} = NOW() AT TIME ZONE 'utc'"
 
                 update_query += ' WHERE id = %s'
                 params.append(course_id)
 
                 cur.execute(update_query, params)
-
-                # Preserve topic content
-                cur.execute('SELECT topic_index, heading, content FROM topics WHERE course_id = %s', (course_id,))
-                existing_topics = {t['heading']: t['content'] for t in cur.fetchall()}
-
-                # Remove topics not in new list
-                cur.execute('DELETE FROM topics WHERE course_id = %s AND heading NOT IN %s', (course_id, tuple(topic_list) if topic_list else ('',)))
-
-                # Add/update topics
-                for index, topic in enumerate(topic_list):
-                    if topic in existing_topics:
-                        # Update topic_index if changed
-                        cur.execute('UPDATE topics SET topic_index = %s WHERE course_id = %s AND heading = %s', (index, course_id, topic))
-                    else:
-                        # Add new topic with empty content
-                        cur.execute('INSERT INTO topics (course_id, topic_index, heading, content) VALUES (%s, %s, %s, %s)', (course_id, index, topic, ''))
+                reconcile_topics(cur, course_id, topic_list)
 
                 db.commit()
+                invalidate_course(course_id)
+                for kind, (path, public_id) in media.items():
+                    media_uploader.schedule(course_id, kind, path, public_id)
                 flash('Course updated!', 'success')
             except psycopg2.Error:
                 db.rollback()
+                for path, _ in media.values():
+                    media_uploader.discard(path)
                 flash('Failed to update course.', 'error')
 
-    cur.execute('SELECT * FROM courses WHERE instructor_id = %s', (session['user_id'],))
+    cur.execute('SELECT * FROM courses WHERE instructor_id = %s', (g.user['id'],))
     courses = cur.fetchall()
     cur.close()
     return render_template('manage_courses.html', courses=courses)
 
+# Bulk import courses from a JSON or CSV upload
+@bp.route('/import_courses', methods=['POST'])
+def import_courses_upload():
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
+    file = request.files.get('courses_file')
+    fmt = file.filename.rsplit('.', 1)[-1].lower() if file and '.' in file.filename else None
+    if fmt not in ('json', 'csv'):
+        flash('Upload a .json or .csv file.', 'error')
+        return redirect(url_for('main.manage_courses'))
+    db = get_db()
+    cur = db.cursor()
+    try:
+        course_ids, topic_count = import_courses(cur, read_courses(file.stream, fmt), g.user['id'])
+        db.commit()
+        invalidate_course()
+        flash(f'Imported {len(course_ids)} courses with {topic_count} topics.', 'success')
+    except CourseImportError as e:
+        db.rollback()
+        flash(str(e), 'error')
+    except psycopg2.Error:
+        db.rollback()
+        flash('Failed to import courses.', 'error')
+    finally:
+        cur.close()
+    return redirect(url_for('main.manage_courses'))
+
+# Stream the instructor's courses as JSON or CSV
+@bp.route('/export_courses')
+def export_courses_download():
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
+    fmt = 'csv' if request.args.get('format') == 'csv' else 'json'
+    dump = dump_csv if fmt == 'csv' else dump_json
+    response = current_app.response_class(
+        stream_with_context(dump(export_courses(get_db(), g.user['id']))),
+        mimetype='text/csv' if fmt == 'csv' else 'application/json'
+    )
+    response.headers.set('Content-Disposition', 'attachment', filename=f'courses.{fmt}')
+    return response
+
 # Manage course topics
-@app.route('/manage_topics')
-@app.route('/manage_topics/<int:course_id>')
+@bp.route('/manage_topics')
+@bp.route('/manage_topics/<int:course_id>')
 def manage_topics(course_id=None):
-    if 'user_id' not in session or session['role'] != 'instructor':
-        return redirect(url_for('index'))
-    db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
+    db = get_read_db()
+    cur = db.cursor()
     if course_id is None:
-        cur.execute('SELECT * FROM courses WHERE instructor_id = %s', (session['user_id'],))
+        cur.execute('SELECT * FROM courses WHERE instructor_id = %s', (g.user['id'],))
         courses = cur.fetchall()
         cur.close()
         return render_template('select_course_for_topics.html', courses=courses)
     else:
-        cur.execute('SELECT t.id, t.course_id, t.topic_index, t.heading, t.content, c.title AS course_title FROM topics t JOIN courses c ON t.course_id = c.id WHERE t.course_id = %s AND c.instructor_id = %s', (course_id, session['user_id']))
+        cur.execute('SELECT t.id, t.course_id, t.topic_index, t.heading, t.content, c.title AS course_title FROM topics t JOIN courses c ON t.course_id = c.id WHERE t.course_id = %s AND c.instructor_id = %s', (course_id, g.user['id']))
         topics = cur.fetchall()
         cur.close()
         if not topics:
             flash('Topic not found or you do not have permission.', 'error')
-            return redirect(url_for('manage_topics'))
+            return redirect(url_for('main.manage_topics'))
         return render_template('manage_topics.html', topics=topics)
 
 # Edit a topic's content
-@app.route('/edit_topic/<int:topic_id>', methods=['GET', 'POST'])
+@bp.route('/edit_topic/<int:topic_id>', methods=['GET', 'POST'])
 def edit_topic(topic_id):
-    if 'user_id' not in session or session['role'] != 'instructor':
-        return redirect(url_for('index'))
+    if not g.user or g.user['role'] != 'instructor':
+        return redirect(url_for('main.index'))
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur = db.cursor()
     cur.execute('SELECT t.*, c.title AS course_title FROM topics t JOIN courses c ON t.course_id = c.id WHERE t.id = %s AND c.instructor_id = %s',
-                       (topic_id, session['user_id']))
+                       (topic_id, g.user['id']))
     topic = cur.fetchone()
     if not topic:
         cur.close()
         flash('Topic not found or you do not have permission.', 'error')
-        return redirect(url_for('manage_topics'))
+        return redirect(url_for('main.manage_topics'))
     if request.method == 'POST':
         content = request.form['content']
         try:
-            cur.execute('UPDATE topics SET content = %s WHERE id = %s', (content, topic_id))
+            cur.execute("UPDATE topics SET content = %s, version = version + 1, updated_at = NOW() AT TIME ZONE 'utc' WHERE id = %s",
+                       (content, topic_id))
             db.commit()
+            invalidate_course(topic['course_id'])
             flash('Topic content updated!', 'success')
             cur.close()
-            return redirect(url_for('manage_topics', course_id=topic['course_id']))
+            return redirect(url_for('main.manage_topics', course_id=topic['course_id']))
         except psycopg2.Error:
             db.rollback()
             flash('Failed to update topic content.', 'error')
@@ -733,4 +1406,4 @@ def edit_topic(topic_id):
 
 # Run app
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""Compare two load.py result files route by route.
+
+    python bench/compare.py bench/results/before.json bench/results/after.json
+"""
+import argparse
+import json
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+
+
+def change(before, after):
+    if before is None or after is None:
+        return "-"
+    if not before:
+        return "new"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline["dataset"] != candidate["dataset"]:
+        print("Warning: the runs used different datasets\n")
+
+    for name, run in (("baseline", baseline), ("candidate", candidate)):
+        print(f"{name:<10} {run.get('git_revision') or '?':<10} {run['started_at']}  {run.get('label', '')}")
+    print(f"\n{'route':<22}" + "".join(f"{m:>24}" for m in METRICS))
+    routes = sorted(set(baseline["routes"]) | set(candidate["routes"]))
+    rows = [(r, baseline["routes"].get(r, {}), candidate["routes"].get(r, {})) for r in routes]
+    rows.append(("TOTAL", baseline["total"], candidate["total"]))
+    for route, old, new in rows:
+        cells = [f"{old.get(m, '-')} -> {new.get(m, '-')} ({change(old.get(m), new.get(m))})" for m in METRICS]
+        print(f"{route:<22}" + "".join(f"{cell:>24}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
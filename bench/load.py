@@ -0,0 +1,260 @@
+"""Drive a running Eduverse server with simulated students and instructors.
+
+    python bench/seed.py --scale 0.1
+    flask --app app run --port 5000          # or gunicorn, in another shell
+    python bench/load.py --users 50 --duration 60
+
+Each virtual user logs in as a seeded account and keeps requesting its
+role's pages with think-time-free weighted picks. Latencies are recorded
+per route after the warm-up period, summarised as p50/p95/p99 and
+throughput, and saved as JSON for ``compare.py``.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MANIFEST = os.path.join(BENCH_DIR, "dataset.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# Relative weight of each action in a role's mix
+STUDENT_MIX = {"courses": 3, "student_dashboard": 3, "topic_page": 4, "list_pdfs": 2}
+INSTRUCTOR_MIX = {"instructor_dashboard": 4, "list_pdfs": 1, "grade_submissions": 2}
+
+COURSE_LINK = re.compile(r'href="/course/(\d+)"')
+SUBMISSION_FIELD = re.compile(r'name="submission_id" value="(\d+)"')
+
+
+class Client:
+    """One keep-alive connection with its own session cookie."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.conn = connection_class(parts.netloc, timeout=timeout)
+        self.cookies = {}
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+        elapsed = time.perf_counter() - start
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookie = SimpleCookie(header)
+            self.cookies.update({key: morsel.value for key, morsel in cookie.items()})
+        return response.status, response.headers, data, elapsed
+
+    def close(self):
+        self.conn.close()
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}  # route -> [seconds]
+        self.errors = {}     # route -> count
+        self.recording = False
+
+    def record(self, route, seconds, ok):
+        if not self.recording:
+            return
+        with self._lock:
+            if ok:
+                self.latencies.setdefault(route, []).append(seconds)
+            else:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, seconds):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / seconds, 2) if seconds else None,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else None,
+        **{f"p{p}_ms": round(percentile(values, p) * 1000, 2) if values else None for p in (50, 95, 99)},
+        "max_ms": round(values[-1] * 1000, 2) if values else None,
+    }
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, args, manifest, role, number, recorder, stop, rng):
+        super().__init__(daemon=True)
+        self.args = args
+        self.manifest = manifest
+        self.role = role
+        self.number = number
+        self.recorder = recorder
+        self.stop = stop
+        self.rng = rng
+        self.course_ids = []
+        self.submission_ids = []
+
+    def call(self, route, method, path, body=None, headers=None, expect=(200,)):
+        try:
+            status, response_headers, data, elapsed = self.client.request(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            self.recorder.record(route, 0, False)
+            return None
+        self.recorder.record(route, elapsed, status in expect)
+        return data if status in expect else None
+
+    def login(self):
+        email = self.manifest[f"{self.role}_email"].format(n=self.number)
+        body = urlencode({"email": email, "password": self.manifest["password"]})
+        self.call("login", "POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"},
+                  expect=(302,))
+        return "session" in self.client.cookies
+
+    def run(self):
+        self.client = Client(self.args.base_url, self.args.timeout)
+        try:
+            if not self.login():
+                return
+            mix = STUDENT_MIX if self.role == "student" else INSTRUCTOR_MIX
+            actions, weights = list(mix), list(mix.values())
+            while not self.stop.is_set():
+                getattr(self, self.rng.choices(actions, weights)[0])()
+        finally:
+            self.client.close()
+
+    # Student actions
+    def student_dashboard(self):
+        data = self.call("student_dashboard", "GET", "/student_dashboard")
+        if data:
+            self.course_ids = [int(i) for i in COURSE_LINK.findall(data.decode("utf-8", "replace"))]
+
+    def courses(self):
+        self.call("courses", "GET", "/courses")
+
+    def topic_page(self):
+        if not self.course_ids:
+            return self.student_dashboard()
+        course_id = self.rng.choice(self.course_ids)
+        topic_index = self.rng.randrange(self.manifest["counts"]["topics_per_course"])
+        self.call("topic_page", "GET", f"/course/{course_id}/topic/{topic_index}")
+
+    def list_pdfs(self):
+        self.call("list_pdfs", "GET", "/pdfs")
+
+    # Instructor actions
+    def instructor_dashboard(self):
+        data = self.call("instructor_dashboard", "GET", "/instructor_dashboard")
+        if data:
+            self.submission_ids = [int(i) for i in SUBMISSION_FIELD.findall(data.decode("utf-8", "replace"))]
+
+    def grade_submissions(self):
+        if not self.submission_ids:
+            return self.instructor_dashboard()
+        batch = [self.submission_ids.pop() for _ in range(min(self.args.grade_batch, len(self.submission_ids)))]
+        body = json.dumps({"grades": [
+            {"submission_id": i, "feedback": "Benchmark feedback.", "grade": self.rng.randint(40, 100)}
+            for i in batch
+        ]})
+        self.call("grade_submissions", "POST", "/grade_submissions", body, {"Content-Type": "application/json"})
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BENCH_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a running Eduverse server.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--instructor-share", type=float, default=0.1, help="fraction of users that are instructors")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="seconds run before measuring")
+    parser.add_argument("--grade-batch", type=int, default=5, help="submissions graded per request")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1, help="random seed for account and action choice")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--label", default="", help="free-form note stored with the results")
+    parser.add_argument("--output", help="results file (default: bench/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    counts = manifest["counts"]
+    rng = random.Random(args.seed)
+    instructors = round(args.users * args.instructor_share)
+    recorder = Recorder()
+    stop = threading.Event()
+    users = []
+    for i in range(args.users):
+        role = "instructor" if i < instructors else "student"
+        number = rng.randrange(counts[f"{role}s"])
+        users.append(VirtualUser(args, manifest, role, number, recorder, stop, random.Random(rng.random())))
+
+    print(f"{args.users} users ({instructors} instructors) against {args.base_url}; "
+          f"{args.warmup:g}s warm-up, {args.duration:g}s measured")
+    for user in users:
+        user.start()
+    time.sleep(args.warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    recorder.recording = False
+    measured = time.perf_counter() - started
+    stop.set()
+    for user in users:
+        user.join(args.timeout)
+
+    routes = {
+        route: summarize(recorder.latencies.get(route, []), recorder.errors.get(route, 0), measured)
+        for route in sorted(set(recorder.latencies) | set(recorder.errors))
+    }
+    everything = [s for values in recorder.latencies.values() for s in values]
+    results = {
+        "label": args.label,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "manifest", "label")},
+        "dataset": {"scale": manifest["scale"], "counts": counts},
+        "routes": routes,
+        "total": summarize(everything, sum(recorder.errors.values()), measured),
+    }
+
+    print(f"\n{'route':<22}{'reqs':>8}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, s in list(routes.items()) + [("TOTAL", results["total"])]:
+        print(f"{route:<22}{s['requests']:>8}{s['errors']:>6}{s['throughput_rps']:>9}"
+              + "".join(f"{s[k] if s[k] is not None else '-':>9}" for k in ("p50_ms", "p95_ms", "p99_ms")))
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Seed a local Postgres database with a synthetic Eduverse dataset.
+
+    python bench/seed.py                  # full size: 50k users, 2k courses, ...
+    python bench/seed.py --scale 0.05     # same shape, 5% of the rows
+    python bench/seed.py --reset          # drop a previous benchmark dataset first
+
+Rows are generated inside Postgres with generate_series, so the full dataset
+loads in a few minutes. Generated accounts use ``@bench.test`` addresses and
+share one password; the counts are written to a manifest that ``load.py``
+reads to log in.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import psycopg2
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import local_env, migrate  # noqa: E402
+from pdf_storage import blob_filename  # noqa: E402
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MANIFEST = os.path.join(BENCH_DIR, "dataset.json")
+PDF_FOLDER = os.path.join(os.path.dirname(BENCH_DIR), "static", "uploads", "pdfs")
+PASSWORD = "benchpass"
+
+# Row counts at --scale 1
+DEFAULTS = {
+    "students": 49_800,
+    "instructors": 200,
+    "courses": 2_000,
+    "topics": 100_000,
+    "enrollments": 1_000_000,
+    "submissions": 500_000,
+    "pdfs": 5_000,
+    "pdf_blobs": 500,
+}
+MAX_MILESTONES = 3      # each enrollment has reached 0..MAX_MILESTONES topics
+GRADED_PERCENT = 70     # the rest sit in the instructors' grading queues
+
+
+def scaled_counts(scale):
+    counts = {key: max(1, int(value * scale)) for key, value in DEFAULTS.items()}
+    counts["topics_per_course"] = max(1, counts.pop("topics") // counts["courses"])
+    counts["enrollments_per_student"] = min(counts["courses"], max(1, counts.pop("enrollments") // counts["students"]))
+    counts["pdf_blobs"] = min(counts["pdf_blobs"], counts["pdfs"])
+    return counts
+
+
+def bench_pdf(i):
+    """Content of the i-th synthetic PDF; small but starts like a real one."""
+    return f"%PDF-1.4\n% eduverse benchmark document {i}\n%%EOF\n".encode()
+
+
+def reset(cur):
+    cur.execute("""
+        DELETE FROM courses WHERE instructor_id IN (SELECT id FROM users WHERE email LIKE '%@bench.test')
+    """)
+    cur.execute("DELETE FROM users WHERE email LIKE '%@bench.test'")
+    digests = [hashlib.sha256(bench_pdf(i)).hexdigest() for i in range(DEFAULTS["pdf_blobs"])]
+    cur.execute("""
+        DELETE FROM pdf_blobs b WHERE b.sha256 = ANY(%s)
+        AND NOT EXISTS (SELECT 1 FROM pdf_resources r WHERE r.sha256 = b.sha256)
+    """, (digests,))
+
+
+def seed(cur, counts):
+    steps = []
+
+    def step(name, statement, params=None):
+        start = time.perf_counter()
+        cur.execute(statement, params)
+        steps.append((name, cur.rowcount, time.perf_counter() - start))
+        print(f"  {name:<22} {cur.rowcount:>10,} rows  {steps[-1][2]:7.1f}s")
+
+    params = dict(counts, password=generate_password_hash(PASSWORD), graded=GRADED_PERCENT,
+                  max_milestones=MAX_MILESTONES)
+    # Course offsets per student are k * stride apart, so a student's
+    # enrollments never repeat a course
+    params["stride"] = max(1, counts["courses"] // counts["enrollments_per_student"])
+
+    for role, key in (("instructor", "instructors"), ("student", "students")):
+        step(f"{role}s", f"""
+            INSERT INTO users (firstname, lastname, email, password, role)
+            SELECT '{role.title()}', n::text, '{role}' || n || '@bench.test', %(password)s, '{role}'
+            FROM generate_series(0, %({key})s - 1) n
+        """, params)
+        cur.execute(f"""
+            CREATE TEMP TABLE bench_{key} ON COMMIT DROP AS
+            SELECT id, row_number() OVER (ORDER BY id) - 1 AS n
+            FROM users WHERE email LIKE '{role}%@bench.test'
+        """)
+        cur.execute(f"CREATE INDEX ON bench_{key} (n)")
+
+    step("courses", """
+        INSERT INTO courses (title, description, instructor_id, topics)
+        SELECT (ARRAY['Introduction to', 'Applied', 'Advanced', 'Foundations of', 'Topics in'])[1 + c %% 5]
+               || ' ' ||
+               (ARRAY['Databases', 'Algorithms', 'Networks', 'Operating Systems', 'Machine Learning',
+                      'Compilers', 'Security', 'Web Development', 'Data Structures', 'Statistics'])[1 + (c / 5) %% 10]
+               || ' ' || c,
+               'A synthetic course covering ' || (c %% 97) || ' ideas about software, data and systems.',
+               i.id,
+               (SELECT string_agg('Topic ' || t, ', ' ORDER BY t) FROM generate_series(1, %(topics_per_course)s) t)
+        FROM generate_series(0, %(courses)s - 1) c
+        JOIN bench_instructors i ON i.n = c %% %(instructors)s
+    """, params)
+    cur.execute("""
+        CREATE TEMP TABLE bench_courses ON COMMIT DROP AS
+        SELECT id, instructor_id, row_number() OVER (ORDER BY id) - 1 AS n
+        FROM courses WHERE instructor_id IN (SELECT id FROM bench_instructors)
+    """)
+    cur.execute("CREATE INDEX ON bench_courses (n)")
+
+    step("topics", """
+        INSERT INTO topics (course_id, topic_index, heading, content)
+        SELECT c.id, t, 'Topic ' || (t + 1),
+               repeat('Lecture notes on indexing, query planning, caching and concurrency. ', 6 + t %% 5)
+        FROM bench_courses c CROSS JOIN generate_series(0, %(topics_per_course)s - 1) t
+    """, params)
+    step("enrollments", """
+        INSERT INTO enrollments (user_id, course_id)
+        SELECT s.id, c.id
+        FROM bench_students s
+        CROSS JOIN generate_series(0, %(enrollments_per_student)s - 1) k
+        JOIN bench_courses c ON c.n = (s.n * 7919 + k * %(stride)s) %% %(courses)s
+    """, params)
+    step("enrollment_milestones", """
+        INSERT INTO enrollment_milestones (user_id, course_id, milestone)
+        SELECT e.user_id, e.course_id, t.heading
+        FROM enrollments e
+        JOIN bench_students s ON s.id = e.user_id
+        JOIN topics t ON t.course_id = e.course_id
+            AND t.topic_index < (e.user_id + e.course_id) %% (%(max_milestones)s + 1)
+    """, params)
+    step("submissions", """
+        INSERT INTO submissions (user_id, course_id, submission_text, submitted_at, feedback, graded_by, grade)
+        SELECT s.id, c.id,
+               'Submission ' || g || ': my answer to the assignment.',
+               NOW() - g * INTERVAL '1 minute',
+               CASE WHEN g %% 100 < %(graded)s THEN 'Well done.' END,
+               CASE WHEN g %% 100 < %(graded)s THEN c.instructor_id END,
+               CASE WHEN g %% 100 < %(graded)s THEN 40 + g %% 61 END
+        FROM generate_series(0, %(submissions)s - 1) g
+        JOIN bench_students s ON s.n = g %% %(students)s
+        JOIN bench_courses c
+            ON c.n = (s.n * 7919 + ((g / %(students)s) %% %(enrollments_per_student)s) * %(stride)s) %% %(courses)s
+    """, params)
+
+    # A few distinct files shared by many resources, like re-uploaded handouts
+    os.makedirs(PDF_FOLDER, exist_ok=True)
+    blobs = []
+    for i in range(counts["pdf_blobs"]):
+        content = bench_pdf(i)
+        digest = hashlib.sha256(content).hexdigest()
+        with open(os.path.join(PDF_FOLDER, blob_filename(digest)), "wb") as f:
+            f.write(content)
+        blobs.append((digest, f"uploads/pdfs/{blob_filename(digest)}", len(content)))
+    cur.execute("CREATE TEMP TABLE bench_blobs (sha256 CHAR(64), file_path TEXT, size BIGINT, n INTEGER) ON COMMIT DROP")
+    cur.executemany("INSERT INTO bench_blobs VALUES (%s, %s, %s, %s)",
+                    [blob + (n,) for n, blob in enumerate(blobs)])
+    step("pdf_blobs", """
+        INSERT INTO pdf_blobs (sha256, file_path, size, ref_count)
+        SELECT sha256, file_path, size, 0 FROM bench_blobs
+        ON CONFLICT (sha256) DO NOTHING
+    """)
+    step("pdf_resources", """
+        INSERT INTO pdf_resources (filename, file_path, uploaded_by, course_id, uploaded_at, sha256)
+        SELECT 'handout_' || p || '.pdf', b.file_path, c.instructor_id, c.id,
+               NOW() - p * INTERVAL '1 hour', b.sha256
+        FROM generate_series(0, %(pdfs)s - 1) p
+        JOIN bench_courses c ON c.n = p %% %(courses)s
+        JOIN bench_blobs b ON b.n = p %% %(pdf_blobs)s
+    """, params)
+    cur.execute("""
+        UPDATE pdf_blobs b SET ref_count = r.refs
+        FROM (SELECT sha256, COUNT(*) AS refs FROM pdf_resources GROUP BY sha256) r
+        WHERE b.sha256 = r.sha256 AND b.sha256 IN (SELECT sha256 FROM bench_blobs)
+    """)
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a local database with a synthetic benchmark dataset.")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier applied to every row count")
+    parser.add_argument("--dsn", help="libpq connection string (defaults to database.local_env)")
+    parser.add_argument("--reset", action="store_true", help="delete a previous benchmark dataset first")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="where to write the dataset description")
+    args = parser.parse_args()
+
+    counts = scaled_counts(args.scale)
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(**local_env)
+    try:
+        migrate(conn)
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM users WHERE email LIKE '%@bench.test'")
+        if cur.fetchone()[0]:
+            if not args.reset:
+                sys.exit("A benchmark dataset already exists; rerun with --reset to replace it.")
+            print("Removing the previous benchmark dataset")
+            reset(cur)
+        start = time.perf_counter()
+        print(f"Seeding at scale {args.scale:g}")
+        steps = seed(cur, counts)
+        conn.commit()
+        # Fresh statistics so the planner sees realistic row counts
+        conn.autocommit = True
+        cur.execute("ANALYZE")
+        cur.close()
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    manifest = {
+        "scale": args.scale,
+        "password": PASSWORD,
+        "student_email": "student{n}@bench.test",
+        "instructor_email": "instructor{n}@bench.test",
+        "counts": counts,
+        "rows": {name: rows for name, rows, _ in steps},
+        "seeded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "seed_seconds": round(elapsed, 1),
+    }
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Done in {elapsed:.1f}s; manifest written to {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Measure cold-start time: importing app.py, create_app() and the first request.
+
+    python bench/startup.py                      # import + factory, checked against the budget
+    python bench/startup.py --first-request      # also time GET /login (needs the database)
+
+Every run is a fresh interpreter, like a newly forked or autoscaled
+worker. Exits non-zero when the median import + create_app time is over
+``--budget-ms``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+DEFAULT_BUDGET_MS = 500
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+result = {"import_ms": (imported - start) * 1000, "create_app_ms": (created - imported) * 1000}
+if "--first-request" in sys.argv:
+    status = application.test_client().get("/login").status_code
+    result["first_request_ms"] = (time.perf_counter() - created) * 1000
+    result["first_request_status"] = status
+print(json.dumps(result))
+"""
+
+
+def run_probe(first_request):
+    args = [sys.executable, "-c", PROBE] + (["--first-request"] if first_request else [])
+    output = subprocess.run(args, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(limit):
+    """Top-level modules imported by app.py, by cumulative import time (-X importtime)."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    imports, children = [], []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Children are listed before their parent, one level deeper
+        if not name.startswith("  "):
+            if name.strip() == "app":
+                imports = children
+            children = []
+        elif not name.startswith("    "):
+            children.append((name.strip(), int(cumulative) / 1000))
+    return sorted(imports, key=lambda item: -item[1])[:limit]
+
+
+def summarize(values):
+    return {
+        "median": round(statistics.median(values), 1),
+        "min": round(min(values), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark application startup time.")
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters to start")
+    parser.add_argument("--first-request", action="store_true", help="also time the first request (needs the database)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="maximum median import + create_app time")
+    parser.add_argument("--output", help="results file (default: bench/results/startup-<timestamp>.json)")
+    args = parser.parse_args()
+
+    runs = [run_probe(args.first_request) for _ in range(args.runs)]
+    phases = [key for key in runs[0] if key.endswith("_ms")]
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "budget_ms": args.budget_ms,
+        "phases": {phase: summarize([run[phase] for run in runs]) for phase in phases},
+        "startup_ms": summarize([run["import_ms"] + run["create_app_ms"] for run in runs]),
+        "slowest_imports_ms": dict(slowest_imports(10)),
+    }
+
+    for phase, stats in list(results["phases"].items()) + [("startup_ms", results["startup_ms"])]:
+        print(f"{phase:<20} median {stats['median']:8.1f}  min {stats['min']:8.1f}  max {stats['max']:8.1f}")
+    print("\nSlowest imports (ms):")
+    for name, ms in results["slowest_imports_ms"].items():
+        print(f"  {name:<24} {ms:8.1f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("startup-%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if results["startup_ms"]["median"] > args.budget_ms:
+        sys.exit(f"Startup median {results['startup_ms']['median']} ms is over the {args.budget_ms:g} ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import csv
+import io
+import json
+
+import psycopg2.extras
+
+
+# Column order of the CSV format: one row per topic, rows of a course kept together
+CSV_FIELDS = ["course_title", "course_description", "topic_heading", "topic_content"]
+EXPORT_BATCH_SIZE = 2000
+
+
+class CourseImportError(ValueError):
+    """Raised when an import file is malformed."""
+
+
+def read_courses(stream, fmt):
+    """Parse a JSON or CSV curriculum into ``[{title, description, topics}]``.
+
+    JSON is a list of ``{"title", "description", "topics": [{"heading",
+    "content"}]}`` objects (topics may also be plain heading strings).
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    if fmt == "json":
+        try:
+            data = json.load(text)
+        except ValueError as e:
+            raise CourseImportError(f"Invalid JSON: {e}")
+        if not isinstance(data, list):
+            raise CourseImportError("JSON import must be a list of courses")
+        courses = []
+        for item in data:
+            if not isinstance(item, dict) or not item.get("title") or not isinstance(item["title"], str):
+                raise CourseImportError("Every course needs a title")
+            if not isinstance(item.get("description") or "", str):
+                raise CourseImportError(f"Description of '{item['title']}' must be text")
+            if not isinstance(item.get("topics") or [], list):
+                raise CourseImportError(f"Topics of '{item['title']}' must be a list")
+            topics = []
+            for t in item.get("topics") or []:
+                if isinstance(t, str):
+                    topics.append({"heading": t, "content": ""})
+                elif (isinstance(t, dict) and isinstance(t.get("heading") or "", str)
+                      and isinstance(t.get("content") or "", str)):
+                    topics.append({"heading": t.get("heading"), "content": t.get("content") or ""})
+                else:
+                    raise CourseImportError(f"Topics of '{item['title']}' must be headings or "
+                                            f"{{\"heading\", \"content\"}} objects")
+            courses.append({"title": item["title"], "description": item.get("description") or "", "topics": topics})
+    elif fmt == "csv":
+        courses = []
+        try:
+            for row in csv.DictReader(text):
+                if not row.get("course_title"):
+                    raise CourseImportError("Every row needs a course_title")
+                if not courses or courses[-1]["title"] != row["course_title"]:
+                    courses.append({"title": row["course_title"], "description": row.get("course_description") or "", "topics": []})
+                if row.get("topic_heading"):
+                    courses[-1]["topics"].append({"heading": row["topic_heading"], "content": row.get("topic_content") or ""})
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise CourseImportError(f"File is not valid UTF-8 CSV: {e}")
+    else:
+        raise CourseImportError(f"Unsupported format: {fmt}")
+    for course in courses:
+        if any(not t["heading"] for t in course["topics"]):
+            raise CourseImportError(f"Topic without a heading in '{course['title']}'")
+    return courses
+
+
+def import_courses(cur, courses, instructor_id):
+    """Insert courses and their topics with batched multi-row INSERTs.
+
+    Course ids are reserved from the sequence up front so topics can be
+    matched to their course without a round trip per course. The caller
+    owns the transaction. Returns ``(course ids, topic count)``.
+    """
+    if not courses:
+        return [], 0
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence('courses', 'id')) FROM generate_series(1, %s)",
+        (len(courses),),
+    )
+    course_ids = [row[0] for row in cur.fetchall()]
+    psycopg2.extras.execute_values(
+        cur,
+        "INSERT INTO courses (id, title, description, instructor_id, topics) VALUES %s",
+        [
+            (course_id, c["title"], c["description"], instructor_id, ", ".join(t["heading"] for t in c["topics"]))
+            for course_id, c in zip(course_ids, courses)
+        ],
+        page_size=500,
+    )
+    topic_rows = [
+        (course_id, index, t["heading"], t["content"])
+        for course_id, c in zip(course_ids, courses)
+        for index, t in enumerate(c["topics"])
+    ]
+    psycopg2.extras.execute_values(
+        cur,
+        "INSERT INTO topics (course_id, topic_index, heading, content) VALUES %s",
+        topic_rows,
+        page_size=1000,
+    )
+    return course_ids, len(topic_rows)
+
+
+def export_courses(conn, instructor_id=None):
+    """Yield courses with their ordered topics, read from a server-side cursor."""
+    cur = conn.cursor(name="course_export", cursor_factory=psycopg2.extras.DictCursor)
+    cur.itersize = EXPORT_BATCH_SIZE
+    cur.execute("""
+        SELECT c.id, c.title, c.description, t.heading, t.content
+        FROM courses c
+        LEFT JOIN topics t ON t.course_id = c.id
+        WHERE %(instructor_id)s IS NULL OR c.instructor_id = %(instructor_id)s
+        ORDER BY c.id, t.topic_index
+    """, {"instructor_id": instructor_id})
+    course = None
+    try:
+        for row in cur:
+            if course is None or course["id"] != row["id"]:
+                if course is not None:
+                    yield course
+                course = {"id": row["id"], "title": row["title"], "description": row["description"] or "", "topics": []}
+            if row["heading"] is not None:
+                course["topics"].append({"heading": row["heading"], "content": row["content"] or ""})
+        if course is not None:
+            yield course
+    finally:
+        cur.close()
+
+
+def dump_json(courses):
+    """Yield a JSON array of courses chunk by chunk."""
+    yield "["
+    for i, course in enumerate(courses):
+        course = {k: v for k, v in course.items() if k != "id"}
+        yield ("," if i else "") + "\n" + json.dumps(course, ensure_ascii=False)
+    yield "\n]\n"
+
+
+def dump_csv(courses):
+    """Yield CSV rows (one per topic) chunk by chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+    for course in courses:
+        for topic in course["topics"] or [{"heading": "", "content": ""}]:
+            writer.writerow([course["title"], course["description"], topic["heading"], topic["content"]])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -1,6 +1,16 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
-from flask import g
+from flask import g, has_app_context, has_request_context, session
+
+import metrics
 
 
 # Database Configuration
@@ -21,119 +31,1100 @@ local_env = {
     "port": 5432
 }
 
+# Connection pool settings (override with environment variables)
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+POOL_MAX_AGE = float(os.environ.get("DB_POOL_MAX_AGE", 1800))
+POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE", 300))
+POOL_PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", 30))
+# Read replicas: libpq DSNs separated by ";" (empty means every read uses the primary)
+REPLICA_DSNS = [dsn.strip() for dsn in os.environ.get("DB_REPLICA_DSNS", "").split(";") if dsn.strip()]
+REPLICA_POOL_SIZE = int(os.environ.get("DB_REPLICA_POOL_SIZE", POOL_MAX_SIZE))
+REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 5))
+REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", 10))
+REPLICA_RETRY_DELAY = float(os.environ.get("DB_REPLICA_RETRY_DELAY", 5))
+# Seconds a session keeps reading from the primary after it commits a write
+STICKY_AFTER_WRITE = float(os.environ.get("DB_STICKY_AFTER_WRITE", 10))
+# Worker threads for run_concurrently(); extra connections still come from the pool
+PARALLEL_WORKERS = int(os.environ.get("DB_PARALLEL_WORKERS", POOL_MAX_SIZE))
+
+# Failover settings: connect timeout and backoff between primary probes
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 5))
+DB_PROBE_MIN_DELAY = float(os.environ.get("DB_PROBE_MIN_DELAY", 1))
+DB_PROBE_MAX_DELAY = float(os.environ.get("DB_PROBE_MAX_DELAY", 60))
+
+
+class CircuitBreaker:
+    """Chooses between the primary (Render) and fallback (local) database.
+
+    While the primary is healthy every connection goes to it. The first
+    failed connect opens the circuit: new connections go straight to the
+    fallback and a background thread probes the primary with exponential
+    backoff, closing the circuit again once it answers.
+    """
+
+    def __init__(self, primary, fallback, connect_timeout=5,
+                 min_delay=1, max_delay=60, on_switch=None):
+        self.primary = primary
+        self.fallback = fallback
+        self.connect_timeout = connect_timeout
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.on_switch = on_switch
+        self._lock = threading.Lock()
+        self._open = False
+        self._prober = None
+        self._last_error = None
+        self._trips = 0
+        self._next_probe = None
+
+    def _connect(self, env, **kwargs):
+        return psycopg2.connect(**env, connect_timeout=self.connect_timeout, **kwargs)
+
+    def connect(self, **kwargs):
+        if not self._open:
+            try:
+                return self._connect(self.primary, **kwargs)
+            except psycopg2.OperationalError as e:
+                self.trip(e)
+        return self._connect(self.fallback, **kwargs)
+
+    def trip(self, error):
+        """Open the circuit and start probing the primary in the background."""
+        with self._lock:
+            self._last_error = str(error)
+            if self._open:
+                return
+            self._open = True
+            self._trips += 1
+            self._prober = threading.Thread(target=self._probe, name="db-probe", daemon=True)
+            self._prober.start()
+        print("⚠️ Render DB connection failed, using local DB:", error)
+        if self.on_switch:
+            self.on_switch()
+
+    def _probe(self):
+        delay = self.min_delay
+        while True:
+            self._next_probe = time.time() + delay
+            time.sleep(delay)
+            try:
+                self._connect(self.primary).close()
+            except psycopg2.OperationalError as e:
+                self._last_error = str(e)
+                delay = min(delay * 2, self.max_delay)
+                continue
+            with self._lock:
+                self._open = False
+                self._prober = None
+                self._next_probe = None
+            print("✅ Render DB reachable again, switching back")
+            if self.on_switch:
+                self.on_switch()
+            return
+
+    def after_fork(self):
+        """Forget the parent's probe thread; the child retries the primary first."""
+        self._lock = threading.Lock()
+        self._open = False
+        self._prober = None
+        self._next_probe = None
+
+    def state(self):
+        return {
+            "active": "local" if self._open else "render",
+            "trips": self._trips,
+            "last_error": self._last_error,
+            "next_probe": self._next_probe,
+        }
+
+
+def _on_backend_switch():
+    # Connections opened against the previous backend are retired
+    if _pool is not None:
+        _pool.reset()
+
+
+_breaker = CircuitBreaker(
+    render_env,
+    local_env,
+    connect_timeout=DB_CONNECT_TIMEOUT,
+    min_delay=DB_PROBE_MIN_DELAY,
+    max_delay=DB_PROBE_MAX_DELAY,
+    on_switch=_on_backend_switch,
+)
+
+
+def get_db_connection(**kwargs):
+    """Connect to whichever of Render/local the circuit breaker says is up."""
+    return _breaker.connect(**kwargs)
+
+
+def db_backend_state():
+    """Which backend is active, how often it failed over and when it next probes."""
+    return _breaker.state()
+
+
+# Schema migrations, applied in order by migrate(). Each entry is
+# (version, description, statements); append new versions at the end and
+# never edit one that has already shipped.
+MIGRATIONS = [
+    (1, "initial schema", [
+        # Users
+        """
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                firstname VARCHAR(100),
+                lastname VARCHAR(100),
+                email VARCHAR(255) UNIQUE,
+                password TEXT,
+                role VARCHAR(50)
+            )
+        """,
+        # Courses
+        """
+            CREATE TABLE IF NOT EXISTS courses (
+                id SERIAL PRIMARY KEY,
+                title VARCHAR(255) NOT NULL,
+                description TEXT,
+                video_url TEXT,
+                video_path TEXT,
+                instructor_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                topics TEXT,
+                image_path TEXT
+            )
+        """,
+        # Enrollments
+        """
+            CREATE TABLE IF NOT EXISTS enrollments (
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
+                milestones TEXT,
+                PRIMARY KEY (user_id, course_id)
+            )
+        """,
+        # Submissions
+        """
+            CREATE TABLE IF NOT EXISTS submissions (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
+                submission_text TEXT,
+                submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                feedback TEXT,
+                graded_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                grade INTEGER
+            )
+        """,
+        # Topics
+        """
+            CREATE TABLE IF NOT EXISTS topics (
+                id SERIAL PRIMARY KEY,
+                course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
+                topic_index INTEGER,
+                heading VARCHAR(255),
+                content TEXT
+            )
+        """,
+        # PDF Resources
+        """
+            CREATE TABLE IF NOT EXISTS pdf_resources (
+                id SERIAL PRIMARY KEY,
+                filename VARCHAR(255) NOT NULL,
+                file_path TEXT NOT NULL,
+                uploaded_by INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
+                uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+    ]),
+    (2, "per-milestone progress rows", [
+        """
+            CREATE TABLE IF NOT EXISTS enrollment_milestones (
+                user_id INTEGER NOT NULL,
+                course_id INTEGER NOT NULL,
+                milestone TEXT NOT NULL,
+                reached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, course_id, milestone),
+                FOREIGN KEY (user_id, course_id)
+                    REFERENCES enrollments(user_id, course_id) ON DELETE CASCADE
+            )
+        """,
+        # Carry over the old comma-separated enrollments.milestones strings
+        """
+            INSERT INTO enrollment_milestones (user_id, course_id, milestone)
+            SELECT e.user_id, e.course_id, m.milestone
+            FROM enrollments e,
+                 unnest(string_to_array(e.milestones, ',')) AS m(milestone)
+            WHERE m.milestone <> ''
+            ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (3, "indexes for hot access paths", [
+        # Renumber topics 0..n-1 per course so topic order can be unique
+        """
+            UPDATE topics t SET topic_index = r.new_index
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY course_id ORDER BY topic_index, id
+                ) - 1 AS new_index
+                FROM topics
+            ) r
+            WHERE t.id = r.id AND t.topic_index IS DISTINCT FROM r.new_index
+        """,
+        """
+            ALTER TABLE topics ADD CONSTRAINT topics_course_order_key
+                UNIQUE (course_id, topic_index) DEFERRABLE INITIALLY DEFERRED
+        """,
+        "CREATE INDEX IF NOT EXISTS courses_instructor_idx ON courses (instructor_id)",
+        "CREATE INDEX IF NOT EXISTS enrollments_course_idx ON enrollments (course_id)",
+        "CREATE INDEX IF NOT EXISTS submissions_user_idx ON submissions (user_id, submitted_at, id)",
+        # Instructor grading queue: only ungraded rows are indexed
+        """
+            CREATE INDEX IF NOT EXISTS submissions_pending_idx
+                ON submissions (course_id, submitted_at, id) WHERE feedback IS NULL
+        """,
+        "CREATE INDEX IF NOT EXISTS pdf_resources_uploaded_idx ON pdf_resources (uploaded_at DESC, id DESC)",
+    ]),
+    (4, "content versions for courses and topics", [
+        """
+            ALTER TABLE courses
+                ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1,
+                ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
+        """,
+        """
+            ALTER TABLE topics
+                ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1,
+                ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
+        """,
+    ]),
+    (5, "background media upload status", [
+        # NULL when no upload is in flight, otherwise 'pending' or 'failed'
+        """
+            ALTER TABLE courses
+                ADD COLUMN IF NOT EXISTS image_status VARCHAR(20),
+                ADD COLUMN IF NOT EXISTS video_status VARCHAR(20)
+        """,
+    ]),
+    (6, "content-addressed PDF storage", [
+        # One row per distinct file; ref_count tracks the pdf_resources using it
+        """
+            CREATE TABLE IF NOT EXISTS pdf_blobs (
+                sha256 CHAR(64) PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                size BIGINT NOT NULL,
+                ref_count INTEGER NOT NULL DEFAULT 0
+            )
+        """,
+        "ALTER TABLE pdf_resources ADD COLUMN IF NOT EXISTS sha256 CHAR(64) REFERENCES pdf_blobs(sha256)",
+    ]),
+    (7, "full-text search", [
+        # Generated columns keep the vectors current on every write
+        """
+            ALTER TABLE courses ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+                ) STORED
+        """,
+        """
+            ALTER TABLE topics ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('english', coalesce(heading, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(content, '')), 'B')
+                ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS courses_search_idx ON courses USING GIN (search_vector)",
+        "CREATE INDEX IF NOT EXISTS topics_search_idx ON topics USING GIN (search_vector)",
+    ]),
+    (8, "user versions for cached snapshots", [
+        # Bumped by every write to a user row so cached copies can be told apart
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+    ]),
+    (9, "incrementally maintained course analytics", [
+        # No writes may slip in between the backfill and the triggers
+        "LOCK TABLE enrollments, enrollment_milestones, submissions IN SHARE ROW EXCLUSIVE MODE",
+        "ALTER TABLE enrollments ADD COLUMN IF NOT EXISTS milestone_count INTEGER NOT NULL DEFAULT 0",
+        """
+            CREATE TABLE IF NOT EXISTS course_stats (
+                course_id INTEGER PRIMARY KEY REFERENCES courses(id) ON DELETE CASCADE,
+                enrollments INTEGER NOT NULL DEFAULT 0,
+                submissions INTEGER NOT NULL DEFAULT 0,
+                graded INTEGER NOT NULL DEFAULT 0,
+                grade_sum BIGINT NOT NULL DEFAULT 0
+            )
+        """,
+        # Enrolled students by number of milestones reached
+        """
+            CREATE TABLE IF NOT EXISTS course_progress_stats (
+                course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
+                milestones INTEGER,
+                students INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (course_id, milestones)
+            )
+        """,
+        # Students who reached each milestone (topic headings, 'Assignment Submitted', ...)
+        """
+            CREATE TABLE IF NOT EXISTS course_milestone_stats (
+                course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
+                milestone TEXT,
+                students INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (course_id, milestone)
+            )
+        """,
+        # Graded submissions per 10-point band (bucket 9 is 90-100)
+        """
+            CREATE TABLE IF NOT EXISTS course_grade_stats (
+                course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
+                bucket INTEGER,
+                submissions INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (course_id, bucket)
+            )
+        """,
+        """
+            CREATE OR REPLACE FUNCTION course_stats_enrollments() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO course_stats (course_id, enrollments) VALUES (NEW.course_id, 1)
+                    ON CONFLICT (course_id) DO UPDATE SET enrollments = course_stats.enrollments + 1;
+                    INSERT INTO course_progress_stats (course_id, milestones, students)
+                    VALUES (NEW.course_id, NEW.milestone_count, 1)
+                    ON CONFLICT (course_id, milestones) DO UPDATE SET students = course_progress_stats.students + 1;
+                ELSE
+                    UPDATE course_stats SET enrollments = enrollments - 1 WHERE course_id = OLD.course_id;
+                    UPDATE course_progress_stats SET students = students - 1
+                    WHERE course_id = OLD.course_id AND milestones = OLD.milestone_count;
+                END IF;
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION course_stats_milestones() RETURNS trigger AS $$
+            DECLARE
+                reached INTEGER;
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE enrollments SET milestone_count = milestone_count + 1
+                    WHERE user_id = NEW.user_id AND course_id = NEW.course_id
+                    RETURNING milestone_count INTO reached;
+                    UPDATE course_progress_stats SET students = students - 1
+                    WHERE course_id = NEW.course_id AND milestones = reached - 1;
+                    INSERT INTO course_progress_stats (course_id, milestones, students) VALUES (NEW.course_id, reached, 1)
+                    ON CONFLICT (course_id, milestones) DO UPDATE SET students = course_progress_stats.students + 1;
+                    INSERT INTO course_milestone_stats (course_id, milestone, students) VALUES (NEW.course_id, NEW.milestone, 1)
+                    ON CONFLICT (course_id, milestone) DO UPDATE SET students = course_milestone_stats.students + 1;
+                ELSE
+                    -- Not found when the enrollment itself is being deleted;
+                    -- its trigger then removes it from its progress bucket
+                    UPDATE enrollments SET milestone_count = milestone_count - 1
+                    WHERE user_id = OLD.user_id AND course_id = OLD.course_id
+                    RETURNING milestone_count INTO reached;
+                    IF FOUND THEN
+                        UPDATE course_progress_stats SET students = students - 1
+                        WHERE course_id = OLD.course_id AND milestones = reached + 1;
+                        INSERT INTO course_progress_stats (course_id, milestones, students) VALUES (OLD.course_id, reached, 1)
+                        ON CONFLICT (course_id, milestones) DO UPDATE SET students = course_progress_stats.students + 1;
+                    END IF;
+                    UPDATE course_milestone_stats SET students = students - 1
+                    WHERE course_id = OLD.course_id AND milestone = OLD.milestone;
+                END IF;
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION course_stats_submissions() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE course_stats SET submissions = submissions - 1,
+                        graded = graded - (OLD.grade IS NOT NULL)::int,
+                        grade_sum = grade_sum - COALESCE(OLD.grade, 0)
+                    WHERE course_id = OLD.course_id;
+                    UPDATE course_grade_stats SET submissions = submissions - 1
+                    WHERE course_id = OLD.course_id AND bucket = LEAST(GREATEST(OLD.grade, 0) / 10, 9);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO course_stats (course_id, submissions, graded, grade_sum)
+                    VALUES (NEW.course_id, 1, (NEW.grade IS NOT NULL)::int, COALESCE(NEW.grade, 0))
+                    ON CONFLICT (course_id) DO UPDATE SET
+                        submissions = course_stats.submissions + 1,
+                        graded = course_stats.graded + EXCLUDED.graded,
+                        grade_sum = course_stats.grade_sum + EXCLUDED.grade_sum;
+                    IF NEW.grade IS NOT NULL THEN
+                        INSERT INTO course_grade_stats (course_id, bucket, submissions)
+                        VALUES (NEW.course_id, LEAST(GREATEST(NEW.grade, 0) / 10, 9), 1)
+                        ON CONFLICT (course_id, bucket) DO UPDATE SET submissions = course_grade_stats.submissions + 1;
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE TRIGGER enrollments_course_stats AFTER INSERT OR DELETE ON enrollments
+                FOR EACH ROW EXECUTE FUNCTION course_stats_enrollments()
+        """,
+        """
+            CREATE TRIGGER enrollment_milestones_course_stats AFTER INSERT OR DELETE ON enrollment_milestones
+                FOR EACH ROW EXECUTE FUNCTION course_stats_milestones()
+        """,
+        """
+            CREATE TRIGGER submissions_course_stats AFTER INSERT OR DELETE ON submissions
+                FOR EACH ROW EXECUTE FUNCTION course_stats_submissions()
+        """,
+        """
+            CREATE TRIGGER submissions_course_stats_update AFTER UPDATE OF grade, course_id ON submissions
+                FOR EACH ROW WHEN (OLD.grade IS DISTINCT FROM NEW.grade OR OLD.course_id IS DISTINCT FROM NEW.course_id)
+                EXECUTE FUNCTION course_stats_submissions()
+        """,
+        # Backfill from the existing rows
+        """
+            UPDATE enrollments e SET milestone_count = m.reached
+            FROM (
+                SELECT user_id, course_id, COUNT(*) AS reached
+                FROM enrollment_milestones GROUP BY user_id, course_id
+            ) m
+            WHERE e.user_id = m.user_id AND e.course_id = m.course_id
+        """,
+        """
+            INSERT INTO course_stats (course_id, enrollments, submissions, graded, grade_sum)
+            SELECT c.id,
+                   (SELECT COUNT(*) FROM enrollments e WHERE e.course_id = c.id),
+                   COUNT(s.id), COUNT(s.grade), COALESCE(SUM(s.grade), 0)
+            FROM courses c LEFT JOIN submissions s ON s.course_id = c.id
+            GROUP BY c.id
+        """,
+        """
+            INSERT INTO course_progress_stats (course_id, milestones, students)
+            SELECT course_id, milestone_count, COUNT(*) FROM enrollments GROUP BY course_id, milestone_count
+        """,
+        """
+            INSERT INTO course_milestone_stats (course_id, milestone, students)
+            SELECT course_id, milestone, COUNT(*) FROM enrollment_milestones GROUP BY course_id, milestone
+        """,
+        """
+            INSERT INTO course_grade_stats (course_id, bucket, submissions)
+            SELECT course_id, LEAST(GREATEST(grade, 0) / 10, 9), COUNT(*)
+            FROM submissions WHERE grade IS NOT NULL GROUP BY 1, 2
+        """,
+    ]),
+    (10, "grading queue claims", [
+        # The grader session holding a pending submission, and until when;
+        # the queue itself is served by submissions_pending_idx
+        """
+            ALTER TABLE submissions
+                ADD COLUMN IF NOT EXISTS claim_token TEXT,
+                ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMP
+        """,
+    ]),
+    (11, "media upload pending timestamps", [
+        # When each background upload was queued, so lost jobs can be failed
+        """
+            ALTER TABLE courses
+                ADD COLUMN IF NOT EXISTS image_pending_since TIMESTAMP,
+                ADD COLUMN IF NOT EXISTS video_pending_since TIMESTAMP
+        """,
+        "UPDATE courses SET image_pending_since = updated_at WHERE image_status = 'pending'",
+        "UPDATE courses SET video_pending_since = updated_at WHERE video_status = 'pending'",
+    ]),
+    (12, "pdf_resources foreign key indexes", [
+        # Deleting a blob or a course checks pdf_resources through these columns
+        "CREATE INDEX IF NOT EXISTS pdf_resources_sha256_idx ON pdf_resources (sha256)",
+        "CREATE INDEX IF NOT EXISTS pdf_resources_course_idx ON pdf_resources (course_id)",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
 
-def get_db_connection():
-    """Try Render DB first, fallback to local."""
+# Arbitrary key for the advisory lock that serializes concurrent migrations
+MIGRATION_LOCK_ID = 4211
+
+
+def _applied_version(cur):
+    cur.execute("SELECT to_regclass('schema_migrations')")
+    if cur.fetchone()[0] is None:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cur.fetchone()[0]
+
+
+def migrate(conn=None):
+    """Apply pending schema migrations and return the resulting version.
+
+    Uses ``conn`` when given (it is left open), otherwise a new connection
+    from ``get_db_connection``.
+    """
+    owned = conn is None
+    if owned:
+        conn = get_db_connection()
     try:
-        return psycopg2.connect(**render_env)
-    except Exception as e:
-        print("⚠️ Render DB connection failed, using local DB:", e)
-        return psycopg2.connect(**local_env)
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        current = _applied_version(cur)
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description),
+            )
+            conn.commit()
+            print(f"Applied migration {version}: {description}")
+            current = version
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        cur.close()
+        return current
+    finally:
+        if owned:
+            conn.close()
 
 
 def init_db():
     """Initialize all tables if they don't exist."""
-    conn = get_db_connection()
-    conn.autocommit = True
-    cur = conn.cursor()
+    return migrate()
 
-    # Users
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            firstname VARCHAR(100),
-            lastname VARCHAR(100),
-            email VARCHAR(255) UNIQUE,
-            password TEXT,
-            role VARCHAR(50)
-        )
-    """)
-
-    # Courses
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS courses (
-            id SERIAL PRIMARY KEY,
-            title VARCHAR(255) NOT NULL,
-            description TEXT,
-            video_url TEXT,
-            video_path TEXT,
-            instructor_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-            topics TEXT,
-            image_path TEXT
-        )
-    """)
-
-    # Enrollments
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS enrollments (
-            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-            course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
-            milestones TEXT,
-            PRIMARY KEY (user_id, course_id)
-        )
-    """)
-
-    # Submissions
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS submissions (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-            course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
-            submission_text TEXT,
-            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            feedback TEXT,
-            graded_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
-            grade INTEGER
-        )
-    """)
-
-    # Topics
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS topics (
-            id SERIAL PRIMARY KEY,
-            course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
-            topic_index INTEGER,
-            heading VARCHAR(255),
-            content TEXT
-        )
-    """)
-
-    # PDF Resources
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS pdf_resources (
-            id SERIAL PRIMARY KEY,
-            filename VARCHAR(255) NOT NULL,
-            file_path TEXT NOT NULL,
-            uploaded_by INTEGER REFERENCES users(id) ON DELETE CASCADE,
-            course_id INTEGER REFERENCES courses(id) ON DELETE CASCADE,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+
+class SchemaOutdated(Exception):
+    """Raised when the database is behind this code's migrations."""
+
+
+def check_schema():
+    """Fast startup check: raise SchemaOutdated if the stored version is behind.
+
+    Never migrates; DDL such as migration 9's table lock and backfill belongs
+    in ``flask init-db`` at deploy time, not inside a web request.
+    """
+    conn = get_pool().getconn()
+    try:
+        cur = conn.cursor()
+        current = _applied_version(cur)
+        cur.close()
+        conn.rollback()
+    finally:
+        get_pool().putconn(conn)
+    if current < SCHEMA_VERSION:
+        print(f"❌ Schema at version {current}, code needs {SCHEMA_VERSION}: run `flask --app app init-db`")
+        raise SchemaOutdated(f"database schema is at version {current}, expected {SCHEMA_VERSION}")
+    return current
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the checkout timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of reusable psycopg2 connections.
+
+    Idle connections are handed out most-recently-used first. On checkout a
+    connection is recycled if it is older than ``max_age`` or has sat idle
+    longer than ``max_idle``, and pinged with ``SELECT 1`` if it has been idle
+    longer than ``ping_after`` seconds.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10,
+                 max_age=1800, max_idle=300, ping_after=30):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = deque()      # (conn, last_used)
+        self._born = {}           # id(conn) -> (creation time, generation)
+        self._generation = 0
+        self._size = 0
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "max_wait": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+        }
+        for _ in range(min_size):
+            conn = self._new_conn()
+            with self._cond:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _new_conn(self):
+        generation = self._generation
+        conn = self._connect()
+        self._born[id(conn)] = (time.monotonic(), generation)
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _current(self, conn):
+        born = self._born.get(id(conn))
+        return born is not None and born[1] == self._generation
+
+    def _usable(self, conn, last_used):
+        """Health check run on checkout, outside the pool lock."""
+        now = time.monotonic()
+        if conn.closed or not self._current(conn):
+            return False
+        if now - self._born[id(conn)][0] > self.max_age:
+            return False
+        if now - last_used > self.max_idle:
+            return False
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self, block=True):
+        """Check out a connection, waiting up to ``timeout`` seconds.
+
+        With ``block=False`` returns None at once if the pool is exhausted.
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    conn, last_used = None, None
+                    self._size += 1
+                    break
+                if not block:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"no connection available after {self.timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+            waited_for = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_time"] += waited_for
+            self._stats["max_wait"] = max(self._stats["max_wait"], waited_for)
+
+        try:
+            if conn is not None and not self._usable(conn, last_used):
+                self._discard(conn)
+                with self._cond:
+                    self._stats["recycled"] += 1
+                conn = None
+            if conn is None:
+                conn = self._new_conn()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        if not discard and not self._current(conn):
+            discard = True
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+        if discard or conn.closed:
+            self._discard(conn)
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def reset(self):
+        """Retire every current connection, e.g. after a backend switch."""
+        with self._cond:
+            self._generation += 1
+        self.closeall()
+
+    def closeall(self):
+        """Close every idle connection; checked-out ones close when returned."""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._discard(conn)
+                self._size -= 1
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                size=self._size,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                max_size=self.max_size,
+            )
+        stats["avg_wait"] = stats["wait_time"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+
+class InstrumentedCursor(psycopg2.extras.DictCursor):
+    """DictCursor that reports every statement's duration to the metrics registry."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.registry.record_query(query, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.registry.record_query(query, time.perf_counter() - start)
+
+
+class PrimaryConnection(psycopg2.extensions.connection):
+    """Primary connection that flags ``g.db_committed`` when a request commits.
+
+    The flag lets the app keep that session's reads on the primary for
+    ``STICKY_AFTER_WRITE`` seconds, so it reads its own writes.
+    """
+
+    def commit(self):
+        super().commit()
+        if has_app_context():
+            g.db_committed = True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pooled_connection():
+    conn = get_db_connection(connection_factory=PrimaryConnection)
+    conn.cursor_factory = InstrumentedCursor
+    return conn
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _pooled_connection,
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    timeout=POOL_TIMEOUT,
+                    max_age=POOL_MAX_AGE,
+                    max_idle=POOL_MAX_IDLE,
+                    ping_after=POOL_PING_AFTER,
+                )
+    return _pool
+
+
+def _reset_after_fork():
+    # A pool opened before a fork (e.g. gunicorn --preload) shares its sockets
+    # with the parent. The child keeps it referenced but never uses or closes
+    # it, and builds its own pool (and query threads) on first use.
+    global _pool, _pool_lock, _router, _parallel_executor, _parallel_lock
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    if _router is not None:
+        _inherited_pools.extend(replica.pool for replica in _router.replicas)
+    _pool = None
+    _router = None
+    _pool_lock = threading.Lock()
+    _breaker.after_fork()
+    _parallel_executor = None
+    _parallel_lock = threading.Lock()
+
+
+_inherited_pools = []
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def pool_stats():
+    """In-use/idle counts and checkout wait times, for sizing the pool."""
+    return get_pool().stats() if _pool is not None else {}
+
+
+class ReplicaLagging(Exception):
+    """Raised by a health check when a replica is too far behind the primary."""
+
+
+class Replica:
+    """One read replica with its own read-only connection pool."""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.pool = ConnectionPool(
+            self._connect,
+            min_size=0,
+            max_size=REPLICA_POOL_SIZE,
+            timeout=POOL_TIMEOUT,
+            max_age=POOL_MAX_AGE,
+            max_idle=POOL_MAX_IDLE,
+            ping_after=POOL_PING_AFTER,
         )
-    """)
+        self.down_until = 0.0
+        self.failures = 0
+        self.checked_at = 0.0
+        self.lag = None
+        self.last_error = None
 
-    cur.close()
-    conn.close()
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connect_timeout=DB_CONNECT_TIMEOUT)
+        conn.set_session(readonly=True)
+        conn.cursor_factory = InstrumentedCursor
+        return conn
+
+
+class ReplicaRouter:
+    """Hands out replica connections round-robin, skipping unhealthy replicas.
+
+    A replica is health-checked on checkout at most every ``check_interval``
+    seconds: it must answer and its replay lag must be under ``max_lag``.
+    A failing replica is skipped for ``retry_delay`` seconds, doubling with
+    each consecutive failure (up to a minute).
+    """
+
+    def __init__(self, dsns, check_interval=5, max_lag=10, retry_delay=5):
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.retry_delay = retry_delay
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def checkout(self):
+        """Return ``(replica, conn)`` from the next healthy replica, or None."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if replica.down_until > time.monotonic():
+                continue
+            # A busy replica is skipped, not waited for; the primary is the last resort
+            try:
+                conn = replica.pool.getconn(block=False)
+            except psycopg2.Error as e:
+                self._mark_down(replica, e)
+                continue
+            if conn is None:
+                continue
+            try:
+                if time.monotonic() - replica.checked_at >= self.check_interval:
+                    self._check(replica, conn)
+            except (psycopg2.Error, ReplicaLagging) as e:
+                replica.pool.putconn(conn, discard=isinstance(e, psycopg2.Error))
+                self._mark_down(replica, e)
+                continue
+            replica.failures = 0
+            return replica, conn
+        return None
+
+    def _check(self, replica, conn):
+        cur = conn.cursor()
+        # Zero when everything received has been replayed (or not a standby)
+        cur.execute("""
+            SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                   ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+        """)
+        replica.lag = float(cur.fetchone()[0] or 0)
+        cur.close()
+        conn.rollback()
+        replica.checked_at = time.monotonic()
+        if replica.lag > self.max_lag:
+            raise ReplicaLagging(f"replica is {replica.lag:.1f}s behind")
+
+    def _mark_down(self, replica, error):
+        delay = min(self.retry_delay * 2 ** replica.failures, 60)
+        replica.failures += 1
+        replica.down_until = time.monotonic() + delay
+        replica.checked_at = 0.0
+        replica.last_error = str(error)
+        print(f"⚠️ Read replica unavailable for {delay:g}s:", error)
+
+    def state(self):
+        now = time.monotonic()
+        return [
+            {
+                "healthy": replica.down_until <= now,
+                "lag": replica.lag,
+                "last_error": replica.last_error,
+                "pool": replica.pool.stats(),
+            }
+            for replica in self.replicas
+        ]
+
+
+_router = None
+
+
+def get_router():
+    """Return the replica router, or None when no replicas are configured."""
+    global _router
+    if _router is None and REPLICA_DSNS:
+        with _pool_lock:
+            if _router is None:
+                _router = ReplicaRouter(
+                    REPLICA_DSNS,
+                    check_interval=REPLICA_CHECK_INTERVAL,
+                    max_lag=REPLICA_MAX_LAG,
+                    retry_delay=REPLICA_RETRY_DELAY,
+                )
+    return _router
+
+
+def replica_state():
+    """Health, lag and pool stats per replica, for monitoring."""
+    return _router.state() if _router is not None else []
+
+
+def wrote_recently():
+    """Whether this session committed on the primary within the sticky window."""
+    return has_request_context() and time.time() - session.get("db_written_at", 0) < STICKY_AFTER_WRITE
 
 
 def get_db():
-    """Get DB connection for Flask request context."""
+    """Get a pooled DB connection for the Flask request context."""
     if "db" not in g:
-        try:
-            g.db = psycopg2.connect(
-                **render_env, cursor_factory=psycopg2.extras.DictCursor
-            )
-        except Exception as e:
-            print("⚠️ Render DB unavailable, switching to local:", e)
-            g.db = psycopg2.connect(
-                **local_env, cursor_factory=psycopg2.extras.DictCursor
-            )
+        start = time.perf_counter()
+        g.db = get_pool().getconn()
+        metrics.registry.record_acquire(time.perf_counter() - start)
     return g.db
 
 
+def get_read_db():
+    """Get a connection for a read-only request, from a replica when possible.
+
+    Falls back to the primary (``get_db``) when no replica is configured or
+    healthy, when this request already uses the primary, and for a while
+    after the session's last write so it reads its own writes.
+    """
+    if "read_db" in g:
+        return g.read_db
+    if "db" in g or wrote_recently():
+        return get_db()
+    router = get_router()
+    picked = router.checkout() if router is not None else None
+    if picked is None:
+        return get_db()
+    g.read_replica, g.read_db = picked
+    return g.read_db
+
+
 def close_db(e=None):
-    """Close DB after request."""
+    """Return the request's DB connections to their pools."""
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        get_pool().putconn(db)
+    read_db = g.pop("read_db", None)
+    if read_db is not None:
+        g.pop("read_replica").pool.putconn(read_db)
+
+
+_parallel_executor = None
+_parallel_lock = threading.Lock()
+
+
+def _get_parallel_executor():
+    global _parallel_executor
+    with _parallel_lock:
+        if _parallel_executor is None:
+            _parallel_executor = ThreadPoolExecutor(PARALLEL_WORKERS, thread_name_prefix="db-parallel")
+        return _parallel_executor
+
+
+def _run_task(pool, conn, task):
+    try:
+        cur = conn.cursor()
+        try:
+            return task(cur)
+        finally:
+            cur.close()
+    finally:
+        pool.putconn(conn)
+
+
+def run_concurrently(conn, *tasks):
+    """Run independent read-only ``task(cursor)`` callables at the same time.
+
+    The first task runs on ``conn`` in the calling thread. Each other task
+    gets its own pooled connection and a worker thread, so the page waits
+    for the slowest query instead of the sum of them. When the pool has no
+    spare connection the task runs on ``conn`` afterwards instead of
+    waiting, so a busy pool degrades to sequential queries, never a
+    deadlock. Tasks see the caller's ``g`` and ``request`` but must not call
+    ``get_db()``. Returns results in task order and re-raises the first error.
+    """
+    pool = get_pool()
+    results = [None] * len(tasks)
+    futures, inline = [], [0]
+    for i, task in enumerate(tasks[1:], 1):
+        extra = pool.getconn(block=False)
+        if extra is None:
+            inline.append(i)
+            continue
+        # Each task gets its own copy of the context (Flask's g and request)
+        context = contextvars.copy_context()
+        futures.append((i, _get_parallel_executor().submit(context.run, _run_task, pool, extra, task)))
+    error = None
+    try:
+        for i in inline:
+            cur = conn.cursor()
+            try:
+                results[i] = tasks[i](cur)
+            finally:
+                cur.close()
+    except Exception as e:
+        error = e
+    for i, future in futures:
+        try:
+            results[i] = future.result()
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+    return results
 
 
 def execute_query(query, params=None, fetch=False):
@@ -0,0 +1,262 @@
+import os
+import secrets
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.utils import secure_filename
+
+from database import get_pool
+
+
+# Media upload settings (override with environment variables)
+MEDIA_STORAGE = os.environ.get("MEDIA_STORAGE", "cloudinary")
+MEDIA_SPOOL_DIR = os.environ.get("MEDIA_SPOOL_DIR", "instance/spool")
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", 2))
+MEDIA_RETRIES = int(os.environ.get("MEDIA_RETRIES", 3))
+MEDIA_RETRY_DELAY = float(os.environ.get("MEDIA_RETRY_DELAY", 2))
+# Uploads still pending after this many seconds were lost with a restarted
+# worker; each process looks for them at most every MEDIA_STALE_CHECK_INTERVAL
+MEDIA_PENDING_TIMEOUT = float(os.environ.get("MEDIA_PENDING_TIMEOUT", 3600))
+MEDIA_STALE_CHECK_INTERVAL = float(os.environ.get("MEDIA_STALE_CHECK_INTERVAL", 300))
+
+# Course columns updated for each kind of media: (path, status, pending since)
+MEDIA_COLUMNS = {
+    "image": ("image_path", "image_status", "image_pending_since"),
+    "video": ("video_path", "video_status", "video_pending_since"),
+}
+
+
+_cloudinary_lock = threading.Lock()
+_cloudinary_configured = False
+
+
+def cloudinary_uploader():
+    """Import and configure the Cloudinary SDK on first use.
+
+    The SDK pulls in requests/urllib3/certifi, so it is kept out of app
+    startup until something is actually uploaded or deleted.
+    """
+    global _cloudinary_configured
+    import cloudinary
+    import cloudinary.uploader
+    with _cloudinary_lock:
+        if not _cloudinary_configured:
+            cloudinary.config(
+                cloud_name=os.environ.get("cloud_name"),
+                api_key=os.environ.get("api_key"),
+                api_secret=os.environ.get("api_secret"),
+                cloud_url=os.environ.get("cloud_url")
+            )
+            _cloudinary_configured = True
+    return cloudinary.uploader
+
+
+class CloudinaryStorage:
+    """Uploads media to Cloudinary and returns its secure URL."""
+
+    def save(self, path, public_id, resource_type):
+        result = cloudinary_uploader().upload(
+            path,
+            public_id=public_id,
+            resource_type=resource_type,
+            overwrite=True
+        )
+        return result["secure_url"]
+
+
+class LocalStorage:
+    """Copies media under ``static/`` and returns the path relative to it."""
+
+    def __init__(self, static_dir="static", subdir="uploads/media"):
+        self.static_dir = static_dir
+        self.subdir = subdir
+
+    def save(self, path, public_id, resource_type):
+        target_dir = os.path.join(self.static_dir, self.subdir)
+        os.makedirs(target_dir, exist_ok=True)
+        shutil.copyfile(path, os.path.join(target_dir, public_id))
+        return f"{self.subdir}/{public_id}"
+
+
+STORAGE_BACKENDS = {
+    "cloudinary": CloudinaryStorage,
+    "local": LocalStorage,
+}
+
+
+class MediaUploader:
+    """Spools course media to disk and uploads it from a worker pool.
+
+    The request only writes the file to the spool directory (``spool``) and
+    calls ``schedule`` once the course row is committed. A worker then pushes
+    it to ``storage`` (retrying with exponential backoff), stores the
+    resulting path on the course and clears its ``*_status`` column, or sets
+    it to ``failed``.
+    """
+
+    def __init__(self, storage, spool_dir, workers=2, retries=3, retry_delay=2, on_complete=None,
+                 pending_timeout=3600, stale_check_interval=300):
+        self.storage = storage
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_complete = on_complete
+        self.pending_timeout = pending_timeout
+        self.stale_check_interval = stale_check_interval
+        self._next_stale_check = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so forked workers each start their own threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="media-upload")
+            return self._executor
+
+    def spool(self, file):
+        """Write an uploaded file to the spool directory and return (path, public id)."""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        public_id = f"{secrets.token_hex(8)}_{secure_filename(file.filename)}"
+        path = os.path.join(self.spool_dir, public_id)
+        file.save(path)
+        return path, public_id
+
+    def schedule(self, course_id, kind, path, public_id):
+        """Hand a spooled file to the worker pool; the caller marks the course pending."""
+        return self._get_executor().submit(self._upload, course_id, kind, path, public_id)
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _upload(self, course_id, kind, path, public_id):
+        try:
+            url = None
+            for attempt in range(self.retries):
+                try:
+                    url = self.storage.save(path, public_id, kind)
+                    break
+                except Exception as e:
+                    print(f"⚠️ {kind} upload for course {course_id} failed (attempt {attempt + 1}):", e)
+                    if attempt + 1 < self.retries:
+                        time.sleep(self.retry_delay * 2 ** attempt)
+            self._finish(course_id, kind, url)
+        finally:
+            self.discard(path)
+
+    def _finish(self, course_id, kind, url):
+        path_column, status_column, since_column = MEDIA_COLUMNS[kind]
+        pool = get_pool()
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            if url is None:
+                cur.execute(f"UPDATE courses SET {status_column} = 'failed', {since_column} = NULL WHERE id = %s",
+                            (course_id,))
+                old_path = None
+            else:
+                cur.execute(f"""
+                    UPDATE courses c SET {path_column} = %s, {status_column} = NULL, {since_column} = NULL,
+                        version = c.version + 1, updated_at = NOW() AT TIME ZONE 'utc'
+                    FROM (SELECT id, {path_column} AS old_path FROM courses WHERE id = %s FOR UPDATE) o
+                    WHERE c.id = o.id
+                    RETURNING o.old_path
+                """, (url, course_id))
+                row = cur.fetchone()
+                old_path = row[0] if row else None
+            conn.commit()
+            cur.close()
+        finally:
+            pool.putconn(conn)
+        # Remove the replaced file if it was stored locally
+        if old_path and old_path != url and not old_path.startswith("http"):
+            try:
+                os.remove(os.path.join("static", old_path))
+            except OSError:
+                pass
+        if self.on_complete:
+            self.on_complete(course_id)
+
+    def check_stale(self):
+        """Queue ``fail_stale`` on the upload workers, at most every ``stale_check_interval`` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_stale_check:
+                return None
+            self._next_stale_check = now + self.stale_check_interval
+        return self._get_executor().submit(self.fail_stale, self.pending_timeout)
+
+    def fail_stale(self, timeout):
+        """Mark uploads pending for over ``timeout`` seconds as failed; returns the course ids.
+
+        Jobs live only in the worker's memory, so a restart loses them and
+        their courses would otherwise stay pending forever. The age is taken
+        from the ``*_pending_since`` column set when the upload was queued.
+        Spooled files left behind by those jobs are removed too. Skipped
+        when the pool has no spare connection; the next check catches up.
+        """
+        stale = {status: f"{status} = 'pending' AND {since} < NOW() AT TIME ZONE 'utc' - %(timeout)s * INTERVAL '1 second'"
+                 for _, status, since in MEDIA_COLUMNS.values()}
+        pool = get_pool()
+        conn = pool.getconn(block=False)
+        if conn is None:
+            return []
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                UPDATE courses SET
+                    {", ".join(f"{status} = CASE WHEN {stale[status]} THEN 'failed' ELSE {status} END, "
+                               f"{since} = CASE WHEN {stale[status]} THEN NULL ELSE {since} END"
+                               for _, status, since in MEDIA_COLUMNS.values())}
+                WHERE {" OR ".join(f"({condition})" for condition in stale.values())}
+                RETURNING id
+            """, {"timeout": timeout})
+            course_ids = [row[0] for row in cur.fetchall()]
+            conn.commit()
+            cur.close()
+        finally:
+            pool.putconn(conn)
+        cutoff = time.time() - timeout
+        try:
+            names = os.listdir(self.spool_dir)
+        except OSError:
+            names = []
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+        if course_ids:
+            print(f"⚠️ Marked stale media uploads of {len(course_ids)} course(s) as failed")
+            if self.on_complete:
+                for course_id in course_ids:
+                    self.on_complete(course_id)
+        return course_ids
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+def create_uploader(on_complete=None):
+    """Build an uploader for the backend named by ``MEDIA_STORAGE``."""
+    return MediaUploader(
+        STORAGE_BACKENDS[MEDIA_STORAGE](),
+        MEDIA_SPOOL_DIR,
+        workers=MEDIA_WORKERS,
+        retries=MEDIA_RETRIES,
+        retry_delay=MEDIA_RETRY_DELAY,
+        on_complete=on_complete,
+        pending_timeout=MEDIA_PENDING_TIMEOUT,
+        stale_check_interval=MEDIA_STALE_CHECK_INTERVAL,
+    )
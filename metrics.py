@@ -0,0 +1,171 @@
+import logging
+import os
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+
+# Statements slower than this (milliseconds) are written to the slow query log
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 500))
+SLOWEST_KEPT = 10
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+slow_query_log = logging.getLogger("eduverse.slow_query")
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+# Literals are masked so parameter values (grades, feedback, tokens) never
+# reach the metrics labels or the slow query log
+_STRING = re.compile(r"(?:\b[EeBbXxUu])?'(?:[^']|'')*'")
+_VALUES_LIST = re.compile(r"\bVALUES\s*\([^()]*\)(?:\s*,\s*\([^()]*\))*", re.IGNORECASE)
+_NUMBER = re.compile(r"(?<![\w.$])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+
+
+def _normalize(statement):
+    """Mask literals and collapse whitespace so the same statement is reported once."""
+    statement = _STRING.sub("?", statement)
+    statement = _VALUES_LIST.sub("VALUES (...)", statement)
+    statement = _NUMBER.sub("?", statement)
+    return re.sub(r"\s+", " ", statement).strip()[:200]
+
+
+def request_db_time():
+    """Database seconds and statement count for the current request so far."""
+    return g.get("_metrics_db_time", 0.0), g.get("_metrics_queries", 0)
+
+
+class Registry:
+    """Process-local request and database metrics.
+
+    Each worker process keeps its own numbers; Prometheus should scrape
+    every worker (or sum them) when running several.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = {}  # (endpoint, method, status) -> Histogram
+        self.db_queries = {}       # endpoint -> statements executed
+        self.db_time = {}          # endpoint -> seconds spent in the database
+        self.acquire = Histogram()
+        self.slowest = {}          # normalized statement -> slowest run in seconds
+
+    def start_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_queries = 0
+        g._metrics_db_time = 0.0
+
+    def record_query(self, statement, seconds):
+        endpoint = "background"
+        if isinstance(statement, bytes):
+            statement = statement.decode("utf-8", "replace")
+        statement = _normalize(str(statement))
+        with self._lock:
+            # Under the lock: database.run_concurrently shares g between threads
+            if has_request_context():
+                endpoint = request.endpoint or "unknown"
+                g._metrics_queries = g.get("_metrics_queries", 0) + 1
+                g._metrics_db_time = g.get("_metrics_db_time", 0.0) + seconds
+            self.db_queries[endpoint] = self.db_queries.get(endpoint, 0) + 1
+            self.db_time[endpoint] = self.db_time.get(endpoint, 0.0) + seconds
+            if seconds > self.slowest.get(statement, 0.0):
+                self.slowest[statement] = seconds
+                if len(self.slowest) > SLOWEST_KEPT:
+                    del self.slowest[min(self.slowest, key=self.slowest.get)]
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            slow_query_log.warning("%.1f ms in %s: %s", seconds * 1000, endpoint, statement)
+
+    def record_acquire(self, seconds):
+        with self._lock:
+            self.acquire.observe(seconds)
+
+    def finish_request(self, response):
+        start = g.get("_metrics_start")
+        if start is None:
+            return response
+        key = (request.endpoint or "unknown", request.method, response.status_code)
+        with self._lock:
+            histogram = self.request_latency.get(key)
+            if histogram is None:
+                histogram = self.request_latency[key] = Histogram()
+            histogram.observe(time.perf_counter() - start)
+        response.headers["Server-Timing"] = (
+            f"db;dur={g.get('_metrics_db_time', 0.0) * 1000:.1f};desc=\"{g.get('_metrics_queries', 0)} queries\""
+        )
+        return response
+
+    def _histogram_lines(self, name, histogram, labels):
+        # Bucket counts are already cumulative
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            yield f"{name}_bucket{_labels(**labels, le=bound)} {count}"
+        yield f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}"
+        yield f"{name}_sum{_labels(**labels)} {histogram.sum}"
+        yield f"{name}_count{_labels(**labels)} {histogram.count}"
+
+    def render(self, gauges=None):
+        """Prometheus text exposition of everything recorded so far.
+
+        ``gauges`` maps metric name to ``(help text, value)`` for point-in-time
+        values such as pool or cache sizes.
+        """
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP eduverse_request_duration_seconds Request latency per Flask endpoint.",
+                "# TYPE eduverse_request_duration_seconds histogram",
+            ]
+            for (endpoint, method, status), histogram in sorted(self.request_latency.items()):
+                lines += self._histogram_lines("eduverse_request_duration_seconds", histogram,
+                                               {"endpoint": endpoint, "method": method, "status": status})
+            lines += [
+                "# HELP eduverse_db_queries_total Statements executed per endpoint.",
+                "# TYPE eduverse_db_queries_total counter",
+            ]
+            lines += [f"eduverse_db_queries_total{_labels(endpoint=e)} {n}" for e, n in sorted(self.db_queries.items())]
+            lines += [
+                "# HELP eduverse_db_time_seconds_total Time spent executing statements per endpoint.",
+                "# TYPE eduverse_db_time_seconds_total counter",
+            ]
+            lines += [f"eduverse_db_time_seconds_total{_labels(endpoint=e)} {t}" for e, t in sorted(self.db_time.items())]
+            lines += [
+                "# HELP eduverse_db_acquire_seconds Time to check a connection out of the pool.",
+                "# TYPE eduverse_db_acquire_seconds histogram",
+            ]
+            lines += self._histogram_lines("eduverse_db_acquire_seconds", self.acquire, {})
+            lines += [
+                "# HELP eduverse_db_slowest_query_seconds Slowest observed run of the slowest statements.",
+                "# TYPE eduverse_db_slowest_query_seconds gauge",
+            ]
+            lines += [
+                f"eduverse_db_slowest_query_seconds{_labels(query=q)} {t}"
+                for q, t in sorted(self.slowest.items(), key=lambda item: -item[1])
+            ]
+        for name, (help_text, value) in (gauges or {}).items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
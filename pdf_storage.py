@@ -0,0 +1,49 @@
+import hashlib
+import os
+import tempfile
+
+
+# PDF upload settings (override with environment variables)
+PDF_MAX_SIZE = int(os.environ.get("PDF_MAX_SIZE", 25 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+
+class PDFRejected(ValueError):
+    """Raised when an upload is too large or is not a PDF."""
+
+
+def blob_filename(digest):
+    return f"{digest}.pdf"
+
+
+def spool_pdf(stream, directory, max_size=PDF_MAX_SIZE):
+    """Copy an upload stream to a temporary file in ``directory``.
+
+    The stream is read in chunks and hashed as it is written, so the size
+    limit is enforced without buffering the whole file. Returns
+    ``(sha256 hex digest, size, temp path)``; the caller moves the temp
+    file to its content-addressed name or removes it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not chunk.startswith(b"%PDF"):
+                    raise PDFRejected("Only PDF files can be uploaded")
+                size += len(chunk)
+                if size > max_size:
+                    raise PDFRejected(f"PDF is larger than {max_size / (1024 * 1024):g} MB")
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise PDFRejected("Uploaded PDF is empty")
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return digest.hexdigest(), size, temp_path
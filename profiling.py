@@ -0,0 +1,172 @@
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import before_render_template, g, request, template_rendered
+
+from metrics import request_db_time
+
+
+# Profiling settings (override with environment variables); off unless a rate is set
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "instance/profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_MIN_MS = float(os.environ.get("PROFILE_MIN_MS", 0))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+
+
+def _collapse(frame):
+    """Render a stack as ``file:function;...`` from the outermost frame in."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    """Samples the stacks of selected requests into collapsed-stack files.
+
+    A background thread looks at every profiled request's thread each
+    ``interval`` seconds, so the request itself pays only for the sampling
+    of its own stack. Each captured request is written to ``directory`` as
+    ``<id>.folded`` (input for flamegraph.pl or speedscope) and ``<id>.json``
+    with the time split between database, templates and view code. Only the
+    ``keep`` slowest captures are kept.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, interval=0.005, min_seconds=0.0, keep=200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.min_seconds = min_seconds
+        self.keep = keep
+        self._active = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def init_app(self, app):
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+
+    def _ensure_sampler(self):
+        # Started lazily so forked workers each run their own sampler
+        with self._lock:
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+    def start_request(self):
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+        stacks = Counter()
+        g._profile = {"start": time.perf_counter(), "stacks": stacks, "template": 0.0}
+        with self._lock:
+            self._active[threading.get_ident()] = stacks
+        self._ensure_sampler()
+
+    def _template_started(self, sender, template, context, **extra):
+        profile = g.get("_profile")
+        if profile is not None:
+            profile["template_start"] = time.perf_counter()
+
+    def _template_finished(self, sender, template, context, **extra):
+        profile = g.get("_profile")
+        if profile is not None and "template_start" in profile:
+            profile["template"] += time.perf_counter() - profile.pop("template_start")
+
+    def finish_request(self, response):
+        profile = g.pop("_profile", None)
+        if profile is None:
+            return response
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        total = time.perf_counter() - profile["start"]
+        if total < self.min_seconds:
+            return response
+        db_time, queries = request_db_time()
+        self._save(profile["stacks"], {
+            "endpoint": request.endpoint or "unknown",
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "status": response.status_code,
+            "captured_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "total_ms": round(total * 1000, 1),
+            "db_ms": round(db_time * 1000, 1),
+            "queries": queries,
+            "template_ms": round(profile["template"] * 1000, 1),
+            "view_ms": round(max(0.0, total - db_time - profile["template"]) * 1000, 1),
+            "samples": sum(profile["stacks"].values()),
+        })
+        return response
+
+    def abandon(self):
+        """Stop sampling a request that ended without a response (teardown)."""
+        if g.pop("_profile", None) is not None:
+            with self._lock:
+                self._active.pop(threading.get_ident(), None)
+
+    def _save(self, stacks, info):
+        os.makedirs(self.directory, exist_ok=True)
+        info["id"] = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(4)}-{info['endpoint']}"
+        with open(os.path.join(self.directory, info["id"] + ".folded"), "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        with open(os.path.join(self.directory, info["id"] + ".json"), "w") as f:
+            json.dump(info, f)
+        for stale in self.captured()[self.keep:]:
+            for ext in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.directory, stale["id"] + ext))
+                except OSError:
+                    pass
+
+    def captured(self):
+        """Summaries of the captured requests, slowest first (shared by all workers)."""
+        profiles = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return profiles
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda p: -p["total_ms"])
+
+    def folded_path(self, profile_id):
+        """Path of a capture's collapsed stacks, or None if the id is unknown."""
+        path = os.path.join(self.directory, os.path.basename(profile_id) + ".folded")
+        return path if os.path.isfile(path) else None
+
+
+profiler = Profiler(
+    PROFILE_DIR,
+    sample_rate=PROFILE_SAMPLE_RATE,
+    interval=PROFILE_INTERVAL_MS / 1000,
+    min_seconds=PROFILE_MIN_MS / 1000,
+    keep=PROFILE_KEEP,
+)
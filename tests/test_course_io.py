@@ -0,0 +1,36 @@
+"""Malformed curriculum files raise CourseImportError, never a 500."""
+import io
+
+import pytest
+
+from course_io import CourseImportError, read_courses
+
+
+@pytest.mark.parametrize("data", [
+    b'{"title": "x"}',
+    b'[{"title": "x", "topics": [1]}]',
+    b'[{"title": "x", "topics": "a"}]',
+    b'[{"title": "x", "topics": [{"heading": 5}]}]',
+    b'[{"title": "x", "description": {"a": 1}}]',
+    "[{\"title\": \"Caf\xe9\"}]".encode("cp1252"),
+])
+def test_malformed_json(data):
+    with pytest.raises(CourseImportError):
+        read_courses(io.BytesIO(data), "json")
+
+
+@pytest.mark.parametrize("data", [
+    "course_title,topic_heading\nCaf\xe9,Intro\n".encode("cp1252"),
+    b'course_title,topic_heading\n"' + b"x" * 200_000 + b'",Intro\n',
+])
+def test_malformed_csv(data):
+    with pytest.raises(CourseImportError, match="not valid UTF-8 CSV"):
+        read_courses(io.BytesIO(data), "csv")
+
+
+def test_csv_round_trip():
+    data = b"course_title,course_description,topic_heading,topic_content\nA,Desc,One,Text\nA,Desc,Two,\n"
+    assert read_courses(io.BytesIO(data), "csv") == [
+        {"title": "A", "description": "Desc", "topics": [
+            {"heading": "One", "content": "Text"}, {"heading": "Two", "content": ""}]},
+    ]
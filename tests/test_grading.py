@@ -0,0 +1,30 @@
+"""Request validation of the bulk grading endpoint."""
+import pytest
+from werkzeug.security import generate_password_hash
+
+from conftest import login
+
+PASSWORD = "grading"
+
+
+@pytest.fixture
+def instructor(app, db):
+    cur = db.cursor()
+    cur.execute("""
+        INSERT INTO users (firstname, lastname, email, password, role)
+        VALUES ('Grading', 'Test', 'instructor@grading.test', %s, 'instructor')
+    """, (generate_password_hash(PASSWORD),))
+    db.commit()
+    yield "instructor@grading.test"
+    cur.execute("DELETE FROM users WHERE email LIKE '%@grading.test'")
+    db.commit()
+    cur.close()
+
+
+@pytest.mark.parametrize("body", ["[1, 2]", '"grades"', "null", "{}", '{"grades": []}', "not json"])
+def test_grade_submissions_rejects_malformed_bodies(app, instructor, body):
+    client = app.test_client()
+    login(client, instructor, PASSWORD)
+    response = client.post("/grade_submissions", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": 'Expected a non-empty "grades" list'}
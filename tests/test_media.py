@@ -0,0 +1,65 @@
+"""Uploads lost with a restarted worker are failed by age of their pending timestamp."""
+import pytest
+
+from media import MediaUploader
+
+
+@pytest.fixture
+def courses(app, db):
+    cur = db.cursor()
+    cur.execute("""
+        INSERT INTO users (firstname, lastname, email, role)
+        VALUES ('Media', 'Test', 'instructor@media.test', 'instructor') RETURNING id
+    """)
+    instructor_id = cur.fetchone()[0]
+    ids = {}
+    # (image pending for, video pending for) in seconds; None means not pending
+    for name, image_age, video_age in (("lost", 7200, None), ("recent", 60, None),
+                                       ("mixed", 60, 7200), ("done", None, None)):
+        cur.execute("""
+            INSERT INTO courses (title, instructor_id, image_status, image_pending_since,
+                                 video_status, video_pending_since)
+            VALUES (%s, %s,
+                    CASE WHEN %s IS NOT NULL THEN 'pending' END,
+                    NOW() AT TIME ZONE 'utc' - %s * INTERVAL '1 second',
+                    CASE WHEN %s IS NOT NULL THEN 'pending' END,
+                    NOW() AT TIME ZONE 'utc' - %s * INTERVAL '1 second')
+            RETURNING id
+        """, (name, instructor_id, image_age, image_age, video_age, video_age))
+        ids[name] = cur.fetchone()[0]
+    db.commit()
+    yield ids
+    cur.execute("DELETE FROM users WHERE email = 'instructor@media.test'")
+    db.commit()
+    cur.close()
+
+
+def statuses(db, course_id):
+    cur = db.cursor()
+    cur.execute("SELECT image_status, video_status FROM courses WHERE id = %s", (course_id,))
+    row = cur.fetchone()
+    cur.close()
+    db.rollback()
+    return row
+
+
+def test_fail_stale_uses_pending_since(app, db, courses, tmp_path):
+    completed = []
+    uploader = MediaUploader(None, str(tmp_path), on_complete=completed.append)
+    failed = uploader.fail_stale(3600)
+    assert sorted(failed) == sorted([courses["lost"], courses["mixed"]])
+    assert sorted(completed) == sorted(failed)
+    assert statuses(db, courses["lost"]) == ("failed", None)
+    assert statuses(db, courses["recent"]) == ("pending", None)
+    assert statuses(db, courses["mixed"]) == ("pending", "failed")
+    assert statuses(db, courses["done"]) == (None, None)
+
+
+def test_check_stale_is_throttled(app, courses, tmp_path):
+    uploader = MediaUploader(None, str(tmp_path), pending_timeout=3600, stale_check_interval=300)
+    try:
+        first = uploader.check_stale()
+        assert first is not None and courses["lost"] in first.result(timeout=10)
+        assert uploader.check_stale() is None
+    finally:
+        uploader.shutdown()
@@ -0,0 +1,84 @@
+"""PDF listing, serving and upload against the configured upload folder."""
+import hashlib
+import io
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from conftest import login
+
+PASSWORD = "pdflisting"
+
+
+@pytest.fixture
+def accounts(app, db):
+    cur = db.cursor()
+    ids = {}
+    for role in ("student", "instructor"):
+        cur.execute("""
+            INSERT INTO users (firstname, lastname, email, password, role)
+            VALUES ('Pdf', 'Listing', %s, %s, %s) RETURNING id
+        """, (f"{role}@pdfs.test", generate_password_hash(PASSWORD), role))
+        ids[role] = cur.fetchone()[0]
+    db.commit()
+    yield ids
+    cur.execute("DELETE FROM users WHERE email LIKE '%@pdfs.test'")
+    db.commit()
+    cur.close()
+
+
+@pytest.mark.parametrize("with_pdf", [False, True])
+@pytest.mark.parametrize("role, dashboard", [("student", "/student_dashboard"),
+                                             ("instructor", "/instructor_dashboard")])
+def test_list_pdfs(app, db, accounts, role, dashboard, with_pdf):
+    if with_pdf:
+        cur = db.cursor()
+        cur.execute("""
+            INSERT INTO pdf_resources (filename, file_path, uploaded_by)
+            VALUES ('listing.pdf', 'uploads/pdfs/listing.pdf', %s)
+        """, (accounts["instructor"],))
+        db.commit()
+        cur.close()
+    client = app.test_client()
+    login(client, f"{role}@pdfs.test", PASSWORD)
+    response = client.get("/pdfs")
+    assert response.status_code == 200
+    assert f'href="{dashboard}"'.encode() in response.data
+    assert (b"listing.pdf" in response.data) == with_pdf
+
+
+def test_pdfs_served_from_configured_upload_folder(app, db, accounts, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(tmp_path))
+    (tmp_path / "pdfs").mkdir()
+    (tmp_path / "pdfs" / "configured.pdf").write_bytes(b"%PDF-1.4 configured")
+    cur = db.cursor()
+    cur.execute("""
+        INSERT INTO pdf_resources (filename, file_path, uploaded_by)
+        VALUES ('configured.pdf', 'uploads/pdfs/configured.pdf', %s) RETURNING id
+    """, (accounts["instructor"],))
+    pdf_id = cur.fetchone()[0]
+    db.commit()
+    cur.close()
+    client = app.test_client()
+    login(client, "student@pdfs.test", PASSWORD)
+    response = client.get(f"/view-pdf/{pdf_id}")
+    assert response.status_code == 200
+    assert response.data == b"%PDF-1.4 configured"
+
+
+def test_failed_upload_removes_the_blob_it_created(app, db, accounts, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(tmp_path))
+    client = app.test_client()
+    login(client, "instructor@pdfs.test", PASSWORD)
+    # No such course, so the pdf_resources insert fails after the blob is in place
+    response = client.post("/upload-pdf", data={
+        "course_id": "0",
+        "pdf_file": (io.BytesIO(b"%PDF-1.4 orphan"), "orphan.pdf"),
+    })
+    assert response.status_code == 302
+    assert list((tmp_path / "pdfs").iterdir()) == []
+    cur = db.cursor()
+    cur.execute("SELECT COUNT(*) FROM pdf_blobs WHERE sha256 = %s",
+                (hashlib.sha256(b"%PDF-1.4 orphan").hexdigest(),))
+    assert cur.fetchone()[0] == 0
+    cur.close()
@@ -0,0 +1,56 @@
+"""Profile edits bump users.version, so stale cached snapshots are reloaded."""
+import pytest
+from werkzeug.security import generate_password_hash
+
+from conftest import login
+
+PASSWORD = "profileedit"
+EMAIL = "student@profile.test"
+
+
+@pytest.fixture
+def student(app, db):
+    cur = db.cursor()
+    cur.execute("""
+        INSERT INTO users (firstname, lastname, email, password, role)
+        VALUES ('Old', 'Name', %s, %s, 'student') RETURNING id
+    """, (EMAIL, generate_password_hash(PASSWORD)))
+    user_id = cur.fetchone()[0]
+    db.commit()
+    yield user_id
+    cur.execute("DELETE FROM users WHERE email LIKE '%@profile.test'")
+    db.commit()
+    cur.close()
+
+
+def test_name_change_bumps_version(app, db, student):
+    client = app.test_client()
+    login(client, EMAIL, PASSWORD)
+    response = client.post("/profile", data={"firstname": "New", "lastname": "Person"})
+    assert response.status_code == 302
+    assert b"New Person" in client.get("/profile").data
+    cur = db.cursor()
+    cur.execute("SELECT firstname, lastname, version FROM users WHERE id = %s", (student,))
+    assert cur.fetchone() == ("New", "Person", 2)
+    cur.close()
+
+
+def test_stale_snapshot_in_another_worker_is_reloaded(app, student):
+    import app as app_module
+    client = app.test_client()
+    login(client, EMAIL, PASSWORD)
+    stale = dict(app_module.user_cache.get(student))
+    client.post("/profile", data={"firstname": "New", "lastname": "Person"})
+    # Another worker still caches the snapshot from before the edit
+    app_module.user_cache.set(student, stale)
+    assert b"New Person" in client.get("/profile").data
+
+
+def test_blank_name_is_rejected(app, db, student):
+    client = app.test_client()
+    login(client, EMAIL, PASSWORD)
+    client.post("/profile", data={"firstname": " ", "lastname": "Person"})
+    cur = db.cursor()
+    cur.execute("SELECT firstname, version FROM users WHERE id = %s", (student,))
+    assert cur.fetchone() == ("Old", 1)
+    cur.close()
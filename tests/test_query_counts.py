@@ -0,0 +1,86 @@
+"""Statements per request must not grow with the number of courses.
+
+Each route is requested once with N courses and once with 10N, and the
+statement counts reported in the Server-Timing header must match.
+"""
+import re
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from conftest import login
+
+N = 5
+PASSWORD = "querycount"
+STUDENT_ROUTES = ["/student_dashboard", "/courses", "/submissions", "/pdfs"]
+INSTRUCTOR_ROUTES = ["/instructor_dashboard", "/manage_topics", "/pdfs"]
+QUERY_COUNT = re.compile(r'desc="(\d+) queries"')
+
+
+@pytest.fixture
+def accounts(app, db):
+    cur = db.cursor()
+    ids = {}
+    for role in ("student", "instructor"):
+        cur.execute("""
+            INSERT INTO users (firstname, lastname, email, password, role)
+            VALUES ('Query', 'Count', %s, %s, %s) RETURNING id
+        """, (f"{role}@querycount.test", generate_password_hash(PASSWORD), role))
+        ids[role] = cur.fetchone()[0]
+    db.commit()
+    yield ids
+    cur.execute("DELETE FROM courses WHERE instructor_id = %s", (ids["instructor"],))
+    cur.execute("DELETE FROM users WHERE email LIKE '%@querycount.test'")
+    db.commit()
+    cur.close()
+
+
+def add_courses(db, accounts, count):
+    """``count`` courses with two topics and a PDF each, each enrolled in and submitted to by the student."""
+    cur = db.cursor()
+    for _ in range(count):
+        cur.execute("""
+            INSERT INTO courses (title, description, instructor_id, topics)
+            VALUES ('Counted course', 'Query count fixture', %s, 'One, Two') RETURNING id
+        """, (accounts["instructor"],))
+        course_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO topics (course_id, topic_index, heading, content)
+            VALUES (%s, 0, 'One', 'First topic'), (%s, 1, 'Two', 'Second topic')
+        """, (course_id, course_id))
+        cur.execute("INSERT INTO enrollments (user_id, course_id) VALUES (%s, %s)", (accounts["student"], course_id))
+        cur.execute("""
+            INSERT INTO enrollment_milestones (user_id, course_id, milestone) VALUES (%s, %s, 'One')
+        """, (accounts["student"], course_id))
+        cur.execute("""
+            INSERT INTO submissions (user_id, course_id, submission_text) VALUES (%s, %s, 'My answer')
+        """, (accounts["student"], course_id))
+        cur.execute("""
+            INSERT INTO pdf_resources (filename, file_path, uploaded_by, course_id)
+            VALUES ('counted.pdf', 'uploads/pdfs/counted.pdf', %s, %s)
+        """, (accounts["instructor"], course_id))
+    db.commit()
+    cur.close()
+
+
+def query_counts(app, email, routes):
+    import app as app_module
+    app_module.catalog_cache.clear()
+    client = app.test_client()
+    login(client, email, PASSWORD)
+    counts = {}
+    for route in routes:
+        response = client.get(route)
+        assert response.status_code == 200, route
+        counts[route] = int(QUERY_COUNT.search(response.headers["Server-Timing"]).group(1))
+    return counts
+
+
+@pytest.mark.parametrize("role, routes", [("student", STUDENT_ROUTES), ("instructor", INSTRUCTOR_ROUTES)])
+def test_query_count_independent_of_course_count(app, db, accounts, role, routes):
+    email = f"{role}@querycount.test"
+    add_courses(db, accounts, N)
+    few = query_counts(app, email, routes)
+    add_courses(db, accounts, 9 * N)
+    many = query_counts(app, email, routes)
+    assert few == many
@@ -0,0 +1,24 @@
+"""Search snippets are escaped before matches are marked."""
+import app
+
+
+def mark(word):
+    return f"{app.HIGHLIGHT_START}{word}{app.HIGHLIGHT_STOP}"
+
+
+def test_matches_are_marked():
+    assert app.highlight(f"a {mark('loop')} runs") == "a <mark>loop</mark> runs"
+
+
+def test_text_between_angle_brackets_is_kept():
+    snippet = f"if a < b and c > {mark('d')}"
+    assert app.highlight(snippet) == "if a &lt; b and c &gt; <mark>d</mark>"
+
+
+def test_markup_in_content_is_escaped():
+    snippet = f"<script>{mark('alert')}(1)</script>"
+    assert app.highlight(snippet) == "&lt;script&gt;<mark>alert</mark>(1)&lt;/script&gt;"
+
+
+def test_empty_snippet():
+    assert app.highlight(None) == ""